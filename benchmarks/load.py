@@ -0,0 +1,463 @@
+"""Load and latency benchmark of the three services of the repository:
+hello_world_restapi, video_hosting_site_restapi and mysql_cloud_sql.
+
+Every service runs in a separate process against a new database seeded
+with --size synthetic records (videos or members) generated from --seed.
+mysql_cloud_sql runs against a SQLite stand-in of the Cloud SQL database
+having the same members table (see the migrations), passed through its
+DATABASE_URI setting.
+
+--threads workers send a weighted mix of requests to the endpoints of the
+service (see ENDPOINTS) for --duration seconds, after --warmup seconds
+which aren't measured. Every worker draws its requests from its own random
+generator seeded from --seed, so that runs with the same settings send
+the same mix of requests. The requests go either through the Flask test
+client (--transport client, which measures the app alone) or over HTTP to
+a local threaded server started by the benchmark (--transport http).
+
+The throughput, the p50/p95/p99 latency and the status codes are reported
+for every endpoint. With --output, they are also written as JSON (with
+sorted keys) which can be diffed between runs or passed to --compare.
+
+Usage:
+    python benchmarks/load.py [--service NAME ...] [--threads N] [--duration S]
+        [--warmup S] [--size N] [--seed N] [--transport client|http]
+        [--no-cache] [--directory DIR] [--output FILE] [--compare FILE]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIRS = {
+    'hello_world': os.path.join(ROOT_DIR, 'hello_world_restapi'),
+    'video': os.path.join(ROOT_DIR, 'video_hosting_site_restapi'),
+    'members': os.path.join(ROOT_DIR, 'mysql_cloud_sql')
+}
+TRANSPORTS = ('client', 'http')
+
+# Names known to hello_world_restapi
+HELLO_WORLD_NAMES = ('tim', 'suyash', 'sonal')
+
+# Schema of the members table of the Cloud SQL database, including the
+# changes of mysql_cloud_sql/migrations, in SQLite's dialect. Names and emails
+# are compared case-insensitively, like in the default collation of the table.
+MEMBERS_TABLE = '''
+CREATE TABLE members (
+    _id INTEGER PRIMARY KEY,
+    name VARCHAR(100) COLLATE NOCASE NOT NULL,
+    email VARCHAR(100) COLLATE NOCASE NOT NULL,
+    updated_at BIGINT NOT NULL DEFAULT 0,
+    name_normalized VARCHAR(100) NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX ux_members_name ON members (name);
+CREATE UNIQUE INDEX ux_members_email ON members (email);
+CREATE INDEX ix_members_updated_at ON members (updated_at);
+CREATE INDEX ix_members_name_normalized ON members (name_normalized);
+CREATE TABLE member_change_sequence (
+    id TINYINT NOT NULL PRIMARY KEY,
+    last_seq BIGINT NOT NULL
+);
+CREATE TABLE member_changes (
+    seq BIGINT NOT NULL PRIMARY KEY,
+    member_id INT NOT NULL,
+    operation VARCHAR(6) NOT NULL,
+    name VARCHAR(100) NULL,
+    email VARCHAR(100) NULL,
+    changed_at BIGINT NOT NULL
+);
+CREATE TABLE jobs (
+    id CHAR(32) NOT NULL PRIMARY KEY,
+    name VARCHAR(64) NOT NULL,
+    running_name VARCHAR(64) NULL,
+    status VARCHAR(9) NOT NULL,
+    progress TEXT NOT NULL,
+    error TEXT NULL,
+    owner CHAR(32) NOT NULL,
+    started_at DOUBLE NOT NULL,
+    heartbeat_at DOUBLE NOT NULL,
+    finished_at DOUBLE NULL
+);
+CREATE UNIQUE INDEX ux_jobs_running_name ON jobs (running_name);
+CREATE INDEX ix_jobs_finished_at ON jobs (finished_at);
+'''
+
+
+class Context:
+    """State shared by the workers while building requests: the size of the
+    dataset and a counter used to build unique IDs, names and emails.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.sequence = itertools.count(1)
+
+
+# Endpoints of every service as (name, weight, build) where build(rng, context)
+# returns the (method, path, JSON body) of a request.
+ENDPOINTS = {
+    'hello_world': [
+        ('GET /helloworld/<name>', 1, lambda rng, ctx: ('GET', f'/helloworld/{rng.choice(HELLO_WORLD_NAMES)}', None))
+    ],
+    'video': [
+        ('GET /video/<id>', 55, lambda rng, ctx: ('GET', f'/video/{rng.randrange(ctx.size)}', None)),
+        ('PATCH /video/<id>', 10, lambda rng, ctx: (
+            'PATCH', f'/video/{rng.randrange(ctx.size)}', {'views': rng.randrange(1, 10 ** 6)}
+        )),
+        ('PUT /video/<id>', 5, lambda rng, ctx: (
+            'PUT', f'/video/{ctx.size + next(ctx.sequence)}', {'name': 'New video', 'views': 0, 'likes': 0}
+        )),
+        ('POST /video/<id>/view', 20, lambda rng, ctx: ('POST', f'/video/{rng.randrange(ctx.size)}/view', None)),
+        ('GET /videos/batch', 10, lambda rng, ctx: (
+            'GET', '/videos/batch?ids=' + ','.join(str(rng.randrange(ctx.size)) for _ in range(20)), None
+        ))
+    ],
+    'members': [
+        ('GET /members/<name>', 50, lambda rng, ctx: ('GET', f'/members/member{rng.randrange(1, ctx.size + 1)}', None)),
+        ('GET /members/search', 10, lambda rng, ctx: (
+            'GET', f'/members/search?q=Member{rng.randrange(1, 1000)}&prefix=true&ci=true', None
+        )),
+        ('GET /members/changes', 5, lambda rng, ctx: (
+            'GET', f'/members/changes?since={rng.randrange(ctx.size)}&limit=100', None
+        )),
+        ('GET /members/all', 1, lambda rng, ctx: ('GET', '/members/all', None)),
+        ('GET /members/all?limit', 10, lambda rng, ctx: (
+            'GET', f'/members/all?limit=100&after_id={rng.randrange(ctx.size)}', None
+        )),
+        ('GET /members/all?format=ndjson', 4, lambda rng, ctx: (
+            'GET', f'/members/all?format=ndjson&limit=100&after_id={rng.randrange(ctx.size)}', None
+        )),
+        ('PATCH /members/<id>/update', 15, lambda rng, ctx: (
+            'PATCH', f'/members/{rng.randrange(1, ctx.size + 1)}/update',
+            {'email': f'member.{next(ctx.sequence)}@example.com'}
+        )),
+        ('PUT /members/<id>/replace', 10, lambda rng, ctx: replace_member(rng, ctx)),
+        ('POST /members/new', 10, lambda rng, ctx: new_member(next(ctx.sequence)))
+    ]
+}
+
+
+def replace_member(rng, ctx):
+    """Build a PUT overwriting a seeded member, keeping its name."""
+    member_id = rng.randrange(1, ctx.size + 1)
+    email = f'member.{next(ctx.sequence)}@example.com'
+    return 'PUT', f'/members/{member_id}/replace', {'name': f'member{member_id}', 'email': email}
+
+
+def new_member(number):
+    """Build a POST creating a new member."""
+    return 'POST', '/members/new', {'name': f'new member {number}', 'email': f'new.{number}@example.com'}
+
+
+def percentile(values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(latencies, statuses, errors, duration):
+    """Return the statistics of the given latencies (in seconds)."""
+    return {
+        'requests': len(latencies),
+        'throughput': len(latencies) / duration,
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0
+    }
+
+
+def import_app(service):
+    """Import the main module of the service and return it."""
+    sys.path.insert(0, APP_DIRS[service])
+    import main
+    return main
+
+
+def set_up_hello_world(args):
+    """Return the app of hello_world_restapi, which doesn't have any data."""
+    return import_app('hello_world').app
+
+
+def set_up_video(args):
+    """Return the app of video_hosting_site_restapi using a new database
+    seeded with --size videos.
+    """
+    rng = random.Random(args.seed)
+    main = import_app('video')
+    main.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{args.database}'
+    if args.no_cache:
+        main.video_cache.max_size = 0
+
+    main.db.create_all()
+    main.db.session.execute(main.VideoModel.__table__.insert(), [
+        {
+            '_id': video_id, 'name': f'Video {video_id}', 'version': 1,
+            'views': rng.randrange(10 ** 6), 'likes': rng.randrange(10 ** 4)
+        }
+        for video_id in range(args.size)
+    ])
+    main.db.session.commit()
+    main.db.session.remove()
+    return main.app
+
+
+def set_up_members(args):
+    """Return the app of mysql_cloud_sql using a new SQLite stand-in of the
+    Cloud SQL database seeded with --size members.
+    """
+    rng = random.Random(args.seed)
+    connection = sqlite3.connect(args.database)
+    connection.executescript(MEMBERS_TABLE)
+    connection.executemany('INSERT INTO members (_id, name, name_normalized, email, updated_at) VALUES (?, ?, ?, ?, ?)', [
+        (member_id, f'member{member_id}', f'member{member_id}', f'member{member_id}@example.com', rng.randrange(10 ** 15))
+        for member_id in range(1, args.size + 1)
+    ])
+    # Start the change log with every member, like the migration creating it
+    connection.execute(
+        "INSERT INTO member_changes SELECT _id, _id, 'upsert', name, email, updated_at FROM members ORDER BY _id"
+    )
+    connection.execute('INSERT INTO member_change_sequence VALUES (1, ?)', (args.size,))
+    connection.commit()
+    connection.close()
+
+    os.environ['DATABASE_URI'] = f'sqlite:///{args.database}?check_same_thread=false'
+    main = import_app('members')
+    if args.no_cache:
+        main.member_cache.max_size = 0
+    return main.app
+
+
+SET_UPS = {
+    'hello_world': set_up_hello_world,
+    'video': set_up_video,
+    'members': set_up_members
+}
+
+
+def client_transport(app):
+    """Return a function creating, for every worker, a function which sends
+    a request through the test client of the app and returns its status code.
+    """
+    def connect():
+        client = app.test_client()
+
+        def send(method, path, body):
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            return response.status_code
+
+        return send
+
+    return connect
+
+
+def http_transport(app):
+    """Start a local threaded server running the app and return a function
+    creating, for every worker, a function which sends a request to it over
+    HTTP and returns its status code.
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def connect():
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=30)
+
+        def send(method, path, body):
+            headers = {}
+            if body is not None:
+                body = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                raise
+            return response.status
+
+        return send
+
+    return connect
+
+
+def run_service(args):
+    """Run the benchmark for a single service in this process and print
+    the results as JSON.
+    """
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = SET_UPS[args.child](args)
+    logging.getLogger(app.name).setLevel(logging.CRITICAL)
+
+    endpoints = ENDPOINTS[args.child]
+    names = [name for name, _, _ in endpoints]
+    weights = [weight for _, weight, _ in endpoints]
+    builders = dict((name, build) for name, _, build in endpoints)
+    connect = (http_transport if args.transport == 'http' else client_transport)(app)
+    context = Context(args.size)
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    errors = Counter()
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + args.warmup
+    deadline = measure_from + args.duration
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        send = connect()
+        local_latencies = defaultdict(list)
+        local_statuses = defaultdict(Counter)
+        local_errors = Counter()
+        while True:
+            name = rng.choices(names, weights)[0]
+            method, path, body = builders[name](rng, context)
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            try:
+                status = send(method, path, body)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            if started < measure_from:
+                continue
+
+            local_latencies[name].append(elapsed)
+            local_statuses[name][status or 'error'] += 1
+            if status is None or status >= 500:
+                local_errors[name] += 1
+
+        with lock:
+            for name in local_latencies:
+                latencies[name].extend(local_latencies[name])
+                statuses[name].update(local_statuses[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {
+        'endpoints': {
+            name: summarize(latencies[name], statuses[name], errors[name], args.duration)
+            for name in names if latencies[name]
+        },
+        'total': summarize(
+            [latency for name in names for latency in latencies[name]],
+            sum(statuses.values(), Counter()), sum(errors.values()), args.duration
+        )
+    }
+    print(json.dumps(results))
+
+
+def print_results(results):
+    """Print a table of the results of every service."""
+    print(f'{"service":<13}{"endpoint":<34}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+    for service, result in results['services'].items():
+        rows = list(result['endpoints'].items()) + [('(total)', result['total'])]
+        for name, stats in rows:
+            print(f'{service:<13}{name:<34}{stats["throughput"]:>9.1f}{stats["p50_ms"]:>9.2f}'
+                f'{stats["p95_ms"]:>9.2f}{stats["p99_ms"]:>9.2f}{stats["errors"]:>8}')
+
+
+def print_comparison(baseline, results):
+    """Print the relative change of the throughput and of the p50/p99
+    latency of every endpoint measured by both runs.
+    """
+    def change(old, new):
+        return f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+
+    if baseline.get('config') != results['config']:
+        print('\nWarning: the baseline was run with different settings:', json.dumps(baseline.get('config')))
+
+    print(f'\n{"service":<13}{"endpoint":<34}{"req/s":>10}{"p50":>10}{"p99":>10}')
+    for service, result in results['services'].items():
+        old_result = baseline.get('services', {}).get(service)
+        if not old_result:
+            continue
+        rows = list(result['endpoints'].items()) + [('(total)', result['total'])]
+        for name, stats in rows:
+            old = old_result['total'] if name == '(total)' else old_result['endpoints'].get(name)
+            if not old:
+                continue
+            print(f'{service:<13}{name:<34}{change(old["throughput"], stats["throughput"]):>10}'
+                f'{change(old["p50_ms"], stats["p50_ms"]):>10}{change(old["p99_ms"], stats["p99_ms"]):>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--service', choices=list(APP_DIRS), action='append',
+        help='Service to benchmark (repeat for several, defaults to all)'
+    )
+    parser.add_argument('--threads', type=int, default=8, help='Number of concurrent workers')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to measure every service for')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Seconds to run every service before measuring')
+    parser.add_argument('--size', type=int, default=10000, help='Number of records to seed the databases with')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the datasets and of the requests')
+    parser.add_argument('--transport', choices=TRANSPORTS, default='client', help='How requests are sent')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the caches of the services')
+    parser.add_argument('--directory', help='Directory to create the databases in')
+    parser.add_argument('--output', help='File to write the results to as JSON')
+    parser.add_argument('--compare', help='Results of a previous run (from --output) to compare against')
+    parser.add_argument('--child', choices=list(APP_DIRS), help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_service(args)
+        return
+
+    config = {
+        'threads': args.threads, 'duration': args.duration, 'warmup': args.warmup, 'size': args.size,
+        'seed': args.seed, 'transport': args.transport, 'cache': not args.no_cache
+    }
+    results = {'config': config, 'services': {}}
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        for service in args.service or list(APP_DIRS):
+            command = [
+                sys.executable, os.path.abspath(__file__), '--child', service,
+                '--database', os.path.join(directory, f'{service}.db'),
+                '--threads', str(args.threads), '--duration', str(args.duration),
+                '--warmup', str(args.warmup), '--size', str(args.size), '--seed', str(args.seed),
+                '--transport', args.transport
+            ]
+            if args.no_cache:
+                command.append('--no-cache')
+            output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            results['services'][service] = json.loads(output.strip().splitlines()[-1])
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+            output_file.write('\n')
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            print_comparison(json.load(baseline_file), results)
+
+
+if __name__ == '__main__':
+    main()
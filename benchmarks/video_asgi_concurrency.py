@@ -0,0 +1,249 @@
+"""Benchmark of video_hosting_site_restapi at high concurrency, comparing
+the threaded server of the current set up (werkzeug, a thread per
+connection, as started by app.run) against the ASGI serving mode of
+video_hosting_site_restapi/asgi.py running on uvicorn.
+
+Every mode runs in a separate server process against a new database seeded
+with --videos videos. --connections clients, all running on a single event
+loop of the benchmark process, send GET and PATCH requests (--write-ratio of
+them PATCH) to /video/<id> over keep-alive connections for --duration
+seconds. With --slow-delay, every client waits that many seconds before
+finishing sending each request, like a client on a slow network would.
+
+The peak number of threads of the server process is sampled from /proc
+(on Linux only) to show what the connections cost the server.
+
+Usage:
+    python benchmarks/video_asgi_concurrency.py [--connections N] [--duration S]
+        [--videos N] [--write-ratio R] [--slow-delay S] [--output FILE]
+
+Requires uvicorn and aiosqlite (see video_hosting_site_restapi/asgi.py).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'video_hosting_site_restapi')
+MODES = ('threaded', 'asgi')
+HOST = '127.0.0.1'
+
+
+def percentile(values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def serve(args):
+    """Seed a new database and serve the video API in the given mode, in
+    this process, until it's terminated.
+    """
+    sys.path.insert(0, APP_DIR)
+    import main
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger(main.app.name).setLevel(logging.CRITICAL)
+    main.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{args.database}'
+    main.db.create_all()
+    main.db.session.execute(main.VideoModel.__table__.insert(), [
+        {'_id': video_id, 'name': f'Video {video_id}', 'views': 0, 'likes': 0, 'version': 1}
+        for video_id in range(args.videos)
+    ])
+    main.db.session.commit()
+    main.db.session.remove()
+
+    if args.serve == 'threaded':
+        from werkzeug.serving import make_server
+
+        make_server(HOST, args.port, main.app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        import asgi
+
+        uvicorn.run(asgi.application, host=HOST, port=args.port, log_level='error', backlog=4096)
+
+
+def free_port():
+    """Return a TCP port which is free at the moment."""
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port, process, timeout=60):
+    """Wait until the server accepts connections on the given port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The server exited with code {process.returncode}')
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('The server didn\'t start listening in time')
+
+
+def thread_count(pid):
+    """Return the number of threads of the given process, or None if unknown."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+async def read_response(reader):
+    """Read a response and return its status code along with whether the
+    server keeps the connection open.
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('The server closed the connection')
+    version, status = status_line.split()[:2]
+    keep_alive = version == b'HTTP/1.1'
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'connection':
+            keep_alive = value.strip().lower() == b'keep-alive' or (keep_alive and value.strip().lower() != b'close')
+    if length:
+        await reader.readexactly(length)
+    return int(status), keep_alive
+
+
+async def run_load(args, port, pid):
+    """Run the clients against the server and return their results."""
+    latencies = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    peak_threads = [thread_count(pid)]
+    deadline = time.perf_counter() + args.duration
+
+    async def client(seed):
+        rng = random.Random(seed)
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            video_id = rng.randrange(args.videos)
+            if rng.random() < args.write_ratio:
+                kind = 'write'
+                body = json.dumps({'views': rng.randrange(1, 10 ** 6)}).encode()
+                head = (f'PATCH /video/{video_id} HTTP/1.1\r\nHost: {HOST}\r\n'
+                    f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n').encode()
+            else:
+                kind = 'read'
+                body = b''
+                head = f'GET /video/{video_id} HTTP/1.1\r\nHost: {HOST}\r\n'.encode()
+
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(HOST, port)
+                writer.write(head)
+                if args.slow_delay:
+                    await writer.drain()
+                    await asyncio.sleep(args.slow_delay)
+                writer.write(b'\r\n' + body)
+                await writer.drain()
+                status, keep_alive = await asyncio.wait_for(read_response(reader), timeout=60)
+                if status >= 500:
+                    errors[kind] += 1
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                errors[kind] += 1
+                keep_alive = False
+            latencies[kind].append(time.perf_counter() - started)
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    async def sample_threads():
+        while time.perf_counter() < deadline:
+            peak_threads.append(thread_count(pid))
+            await asyncio.sleep(0.2)
+
+    await asyncio.gather(sample_threads(), *(client(seed) for seed in range(args.connections)))
+
+    results = {}
+    for kind, values in latencies.items():
+        results[kind] = {
+            'requests': len(values),
+            'throughput': len(values) / args.duration,
+            'errors': errors[kind],
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'mean_ms': statistics.mean(values) * 1000 if values else 0.0
+        }
+    known_threads = [count for count in peak_threads if count is not None]
+    results['peak_server_threads'] = max(known_threads) if known_threads else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=200, help='Number of concurrent client connections')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run every mode for')
+    parser.add_argument('--videos', type=int, default=10000, help='Number of videos to seed the database with')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='Fraction of the requests which are writes')
+    parser.add_argument('--slow-delay', type=float, default=0.0, help='Seconds every client takes to send a request')
+    parser.add_argument('--directory', help='Directory to create the databases in')
+    parser.add_argument('--output', help='File to write the results to as JSON')
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        for mode in MODES:
+            port = free_port()
+            command = [
+                sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port),
+                '--database', os.path.join(directory, f'{mode}.db'), '--videos', str(args.videos)
+            ]
+            server = subprocess.Popen(command)
+            try:
+                wait_until_listening(port, server)
+                results[mode] = asyncio.run(run_load(args, port, server.pid))
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(f'{"mode":<10}{"kind":<7}{"req/s":>10}{"errors":>8}{"p50 ms":>10}{"p99 ms":>10}{"threads":>9}')
+    for mode, result in results.items():
+        for kind in ('read', 'write'):
+            stats = result[kind]
+            print(f'{mode:<10}{kind:<7}{stats["throughput"]:>10.1f}{stats["errors"]:>8}'
+                f'{stats["p50_ms"]:>10.2f}{stats["p99_ms"]:>10.2f}{result["peak_server_threads"] or "?":>9}')
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'config': vars(args), 'results': results}, output_file, indent=2, sort_keys=True)
+            output_file.write('\n')
+
+
+if __name__ == '__main__':
+    main()
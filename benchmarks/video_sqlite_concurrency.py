@@ -0,0 +1,146 @@
+"""Benchmark of the read/write throughput of video_hosting_site_restapi
+under concurrent requests, comparing the default SQLite set up (rollback
+journal, a new connection per request) against the tuned profile of
+video_hosting_site_restapi/sqlite_profile.py (WAL, pooled connections).
+
+Every profile runs in a separate process against a new database seeded
+with --videos videos. --threads workers send a mix of GET and PATCH
+requests (--write-ratio of them PATCH) to /video/<id> for --duration seconds
+through the Flask test client. The video cache is disabled so that every
+read goes to the database.
+
+Usage:
+    python benchmarks/video_sqlite_concurrency.py [--threads N] [--duration S]
+        [--videos N] [--write-ratio R] [--directory DIR]
+
+Use --directory to put the databases on the disk the service runs on, since
+the cost of syncing the journal depends on it.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'video_hosting_site_restapi')
+PROFILES = ('baseline', 'tuned')
+
+
+def percentile(values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_profile(args):
+    """Run the benchmark for a single profile in this process and print
+    the results as JSON.
+    """
+    sys.path.insert(0, APP_DIR)
+    import main
+
+    logging.getLogger(main.app.name).setLevel(logging.CRITICAL)
+    main.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{args.database}'
+    main.video_cache.max_size = 0
+    if args.profile == 'baseline':
+        main.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+        main.db.pragmas = {}
+
+    main.db.create_all()
+    main.db.session.execute(main.VideoModel.__table__.insert(), [
+        {'_id': video_id, 'name': f'Video {video_id}', 'views': 0, 'likes': 0, 'version': 1}
+        for video_id in range(args.videos)
+    ])
+    main.db.session.commit()
+    main.db.session.remove()
+
+    latencies = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = main.app.test_client()
+        local = {'read': [], 'write': []}
+        local_errors = {'read': 0, 'write': 0}
+        while time.perf_counter() < deadline:
+            video_id = rng.randrange(args.videos)
+            started = time.perf_counter()
+            if rng.random() < args.write_ratio:
+                kind = 'write'
+                response = client.patch(f'/video/{video_id}', data={'views': rng.randrange(1, 10 ** 6)})
+            else:
+                kind = 'read'
+                response = client.get(f'/video/{video_id}')
+            local[kind].append(time.perf_counter() - started)
+            if response.status_code >= 500:
+                local_errors[kind] += 1
+        with lock:
+            for kind in latencies:
+                latencies[kind].extend(local[kind])
+                errors[kind] += local_errors[kind]
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    for kind, values in latencies.items():
+        results[kind] = {
+            'requests': len(values),
+            'throughput': len(values) / args.duration,
+            'errors': errors[kind],
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'mean_ms': statistics.mean(values) * 1000 if values else 0.0
+        }
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16, help='Number of concurrent workers')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run every profile for')
+    parser.add_argument('--videos', type=int, default=10000, help='Number of videos to seed the database with')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Fraction of the requests which are writes')
+    parser.add_argument('--directory', help='Directory to create the databases in')
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        run_profile(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        for profile in PROFILES:
+            command = [
+                sys.executable, os.path.abspath(__file__), '--profile', profile,
+                '--database', os.path.join(directory, f'{profile}.db'),
+                '--threads', str(args.threads), '--duration', str(args.duration),
+                '--videos', str(args.videos), '--write-ratio', str(args.write_ratio)
+            ]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print(f'{"profile":<10}{"kind":<7}{"req/s":>10}{"errors":>8}{"p50 ms":>10}{"p99 ms":>10}')
+    for profile, kinds in results.items():
+        for kind, result in kinds.items():
+            print(f'{profile:<10}{kind:<7}{result["throughput"]:>10.1f}{result["errors"]:>8}'
+                f'{result["p50_ms"]:>10.2f}{result["p99_ms"]:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,24 @@
+import os
+
+import click
 from flask import Flask
-from flask_restful import Api, Resource
+from flask_restful import Api, Resource, abort
+
+from metrics import RequestMetrics
+from profile_store import ProfileStore, read_profiles, write_store
 
 app = Flask(__name__)
 api = Api(app)
 
+# Latency of every request, exposed at /metrics (the app doesn't use a database)
+request_metrics = RequestMetrics(app, instrument_sql=False)
+
+# Path of the profile store built by the build-profile-store command. If it
+# doesn't exist, the profiles of the names dict below are served instead.
+# The store is opened once at start up, so the app has to be restarted to
+# serve a new store.
+PROFILE_STORE_PATH = os.path.join(app.root_path, "profiles.store")
+
 names = {
     "tim": {
         "age": 19,
@@ -19,6 +34,11 @@ names = {
     }
 }
 
+if os.path.exists(PROFILE_STORE_PATH):
+    profiles = ProfileStore.open(PROFILE_STORE_PATH)
+else:
+    profiles = ProfileStore.from_profiles(names)
+
 
 class HelloWorld(Resource):
 
@@ -31,8 +51,14 @@ class HelloWorld(Resource):
         Returns the response as a dict (formatted
         as a JSON object) because it support serialization i.e.,
         conversion of an object into a sequence of bits/byte stream.
+
+        Abort with a 404 error code if there is no profile with the
+        given name.
         """
-        return names[name]
+        profile = profiles.get(name)
+        if profile is None:
+            abort(404, message="No profile exists with the given name...")
+        return profile
 
     def post(self):
         """Handle POST requests at the URL registered for
@@ -43,5 +69,22 @@ class HelloWorld(Resource):
 
 api.add_resource(HelloWorld, "/helloworld/<string:name>")
 
+
+@app.cli.command("build-profile-store")
+@click.argument("source", type=click.Path(exists=True, dir_okay=False))
+@click.argument("destination", type=click.Path(dir_okay=False), default=PROFILE_STORE_PATH)
+def build_profile_store(source, destination):
+    """Build the profile store served by the app from a JSON or CSV file
+    of profiles (see profile_store.read_profiles), writing it to
+    DESTINATION (PROFILE_STORE_PATH by default).
+    """
+    try:
+        store_profiles = read_profiles(source)
+        write_store(store_profiles, destination)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f"Stored {len(store_profiles)} profiles in {destination}")
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,159 @@
+"""Pre-forking multi-process server for the Flask app of main.py.
+
+The master process imports the app and binds the listening socket once,
+then forks the worker processes, which all accept connections from that
+socket and serve them with a thread per request, like app.run does. Workers
+share the memory of the imported app until they write to it, and a worker
+which dies is replaced.
+
+This app doesn't cache anything, so unlike the prefork.py of the video and
+members apps, the master doesn't relay invalidation messages between the
+workers.
+
+The workers write snapshots of their metrics to a temporary directory
+created by the master, named by the METRICS_DIR_ENV environment variable,
+so that /metrics exposes the metrics of all the workers (see metrics.py).
+
+Usage (on Unix only):
+    python prefork.py [--host HOST] [--port PORT] [--workers N] [--no-threads]
+
+The number of workers defaults to WEB_CONCURRENCY if set, or else the
+number of CPUs available to the process.
+"""
+import argparse
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+# Environment variable telling the workers the directory where they write
+# the snapshots of their metrics
+METRICS_DIR_ENV = "PREFORK_METRICS_DIR"
+# Seconds the master sleeps between two checks on the workers
+POLL_INTERVAL = 0.5
+
+
+def default_workers():
+    """Return the number of workers to run by default."""
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.getenv("WEB_CONCURRENCY"))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class PreforkServer:
+    """Serves a WSGI app with 'workers' processes forked from this one."""
+
+    def __init__(self, app, host="127.0.0.1", port=5000, workers=None, threaded=True):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or default_workers()
+        self.threaded = threaded
+        self.server = None
+        # PIDs of the running workers
+        self._pids = set()
+        self._master_pid = os.getpid()
+        self._stopping = False
+
+    def serve_forever(self):
+        """Bind the socket, start the workers and supervise them until the
+        master receives SIGINT or SIGTERM.
+        """
+        self.server = make_server(self.host, self.port, self.app, threaded=self.threaded)
+        # Every worker waits for connections on the socket, and the ones
+        # which lose the race for a connection mustn't block in accept().
+        self.server.socket.setblocking(False)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        metrics_dir = os.environ[METRICS_DIR_ENV] = tempfile.mkdtemp(prefix="prefork-metrics-")
+
+        logger.info("Serving on http://%s:%d with %d workers", self.host, self.server.server_port, self.workers)
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while not self._stopping:
+                time.sleep(POLL_INTERVAL)
+                self._reap()
+        finally:
+            # A worker exiting unwinds this frame as well
+            if os.getpid() == self._master_pid:
+                self._stop_workers()
+                shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    def _spawn(self):
+        """Fork a new worker."""
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+            sys.exit(0)
+        self._pids.add(pid)
+
+    def _run_worker(self):
+        """Serve requests in a newly forked worker until it's terminated."""
+        self._pids = set()
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # Exiting through SystemExit runs the atexit hooks of the app
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.server.serve_forever()
+
+    def _reap(self):
+        """Replace the workers which have exited."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            if pid not in self._pids:
+                continue
+            self._pids.discard(pid)
+            if not self._stopping:
+                logger.warning("Worker %d exited with status %d, starting a new one", pid, status)
+                self._spawn()
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _stop_workers(self):
+        """Terminate the workers and wait until they have exited."""
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self._pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self._pids = set()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--no-threads", action="store_true", help="Handle a single request at a time per worker")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(process)d] %(message)s")
+    from main import app
+
+    PreforkServer(app, args.host, args.port, args.workers, threaded=not args.no_threads).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import csv
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left
+
+# Layout of a store file:
+#   1. The header (HEADER): magic number, format version, width of a key,
+#      number of profiles and length of the table of genders.
+#   2. The table of genders, a JSON list of the distinct genders of the
+#      profiles, which the records refer to by position.
+#   3. The index: the UTF-8 encoded names of the profiles, padded with NUL
+#      bytes to the width of a key, in ascending order of their bytes.
+#   4. The records (RECORD): the age and the position of the gender of every
+#      profile, in the same order as the index.
+HEADER = struct.Struct("<4sHHIH")
+RECORD = struct.Struct("<HB")
+MAGIC = b"HWPS"
+VERSION = 1
+
+MAX_AGE = 2 ** 16 - 1
+MAX_GENDERS = 2 ** 8
+
+
+class ProfileStore:
+    """A read-only store of profiles (the age and gender of a person, by
+    name) kept in a compact binary file with fixed-width records.
+
+    A store opened from a file is memory mapped: nothing is read or parsed
+    when it's opened, and the pages of the file touched by lookups are
+    loaded on demand and shared by every process serving the same file.
+    A name is looked up with a binary search of the sorted index of names.
+    """
+
+    def __init__(self, buffer):
+        magic, version, key_width, count, genders_length = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a profile store, or a store of an unsupported version")
+
+        self._buffer = buffer
+        self._key_width = key_width
+        self._count = count
+        self._genders = json.loads(bytes(buffer[HEADER.size:HEADER.size + genders_length]))
+        self._keys = _Keys(buffer, HEADER.size + genders_length, key_width, count)
+        self._records_offset = HEADER.size + genders_length + key_width * count
+
+    @classmethod
+    def open(cls, path):
+        """Open the store file at the given path, memory mapping it."""
+        with open(path, "rb") as store_file:
+            return cls(mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_profiles(cls, profiles):
+        """Return a store held in memory containing the given profiles
+        (see pack_profiles).
+        """
+        return cls(pack_profiles(profiles))
+
+    def get(self, name, default=None):
+        """Return the profile of the given name as a dict containing its
+        age and gender, or default if there is no such profile.
+
+        Names containing a NUL character are never stored (see
+        pack_profiles), so they aren't looked up: once padded, "tim\\0"
+        would be the key of "tim".
+        """
+        key = name.encode("utf-8", "surrogatepass")
+        if len(key) > self._key_width or b"\0" in key:
+            return default
+
+        key = key.ljust(self._key_width, b"\0")
+        position = bisect_left(self._keys, key)
+        if position == self._count or self._keys[position] != key:
+            return default
+
+        age, gender = RECORD.unpack_from(self._buffer, self._records_offset + position * RECORD.size)
+        return {"age": age, "gender": self._genders[gender]}
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def close(self):
+        """Unmap the file of the store, if it was opened from a file."""
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+
+class _Keys:
+    """Sequence of the (padded) keys of the index of a store, read from
+    its buffer on access, so that it can be searched by bisect.
+    """
+
+    def __init__(self, buffer, offset, width, count):
+        self._buffer = buffer
+        self._offset = offset
+        self._width = width
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        start = self._offset + position * self._width
+        return self._buffer[start:start + self._width]
+
+
+def pack_profiles(profiles):
+    """Return the contents of a store file containing the given profiles,
+    given as a dict mapping every name to a dict containing its age and gender.
+
+    Raise a ValueError if a profile can't be stored, i.e. if its age isn't
+    an integer between 0 and MAX_AGE, if its gender isn't a string or if
+    there are more than MAX_GENDERS distinct genders.
+    """
+    genders = {}
+    entries = []
+    for name, profile in profiles.items():
+        if not isinstance(profile, dict):
+            raise ValueError(f"The profile of {name!r} should be an object containing an age and a gender")
+        age, gender = profile.get("age"), profile.get("gender")
+        if not isinstance(age, int) or isinstance(age, bool) or not 0 <= age <= MAX_AGE:
+            raise ValueError(f"The age of {name!r} should be an integer between 0 and {MAX_AGE}")
+        if not isinstance(gender, str):
+            raise ValueError(f"The gender of {name!r} should be a string")
+        if "\0" in name:
+            raise ValueError(f"The name {name!r} cannot contain a NUL character")
+        if gender not in genders:
+            if len(genders) == MAX_GENDERS:
+                raise ValueError(f"Cannot store more than {MAX_GENDERS} distinct genders")
+            genders[gender] = len(genders)
+        entries.append((name.encode("utf-8", "surrogatepass"), age, genders[gender]))
+
+    key_width = max((len(key) for key, age, gender in entries), default=0)
+    entries = sorted((key.ljust(key_width, b"\0"), age, gender) for key, age, gender in entries)
+    genders_table = json.dumps(list(genders)).encode("utf-8")
+
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, key_width, len(entries), len(genders_table)),
+        genders_table,
+        b"".join(key for key, age, gender in entries),
+        b"".join(RECORD.pack(age, gender) for key, age, gender in entries)
+    ])
+
+
+def write_store(profiles, path):
+    """Write a store file containing the given profiles to the given path.
+
+    The file is written to a temporary path first and moved into place, so
+    that a process opening the store concurrently never maps a partial file.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as store_file:
+        store_file.write(pack_profiles(profiles))
+    os.replace(temp_path, path)
+
+
+def read_profiles(path):
+    """Read the profiles to store from a JSON or a CSV file, depending on
+    the extension of its path, and return them as a dict mapping every
+    name to a dict containing its age and gender.
+
+    A JSON file contains either an object in that same format or a list of
+    objects having a name, an age and a gender. A CSV file has a header row
+    naming its name, age and gender columns.
+
+    Raise a ValueError if the file isn't in one of these formats or if it
+    contains the same name more than once.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as csv_file:
+            reader = csv.DictReader(csv_file)
+            missing = {"name", "age", "gender"} - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"The CSV file has no column named {', '.join(sorted(missing))}")
+            rows = []
+            for row in reader:
+                try:
+                    age = int(row["age"])
+                except (TypeError, ValueError):
+                    raise ValueError(f"The age of {row['name']!r} should be an integer")
+                rows.append({"name": row["name"], "age": age, "gender": row["gender"]})
+    else:
+        with open(path, encoding="utf-8") as json_file:
+            document = json.load(json_file)
+        if isinstance(document, dict):
+            return document
+        if not isinstance(document, list):
+            raise ValueError("The JSON file should contain an object or a list of profiles")
+        rows = document
+
+    profiles = {}
+    for row in rows:
+        if not isinstance(row, dict) or not isinstance(row.get("name"), str):
+            raise ValueError("Every profile should be an object containing a name, an age and a gender")
+        if row["name"] in profiles:
+            raise ValueError(f"The name {row['name']!r} appears more than once")
+        profiles[row["name"]] = {"age": row.get("age"), "gender": row.get("gender")}
+    return profiles
@@ -4,3 +4,10 @@ BASE_URL = "http://127.0.0.1:5000/"
 
 response = requests.get(BASE_URL + "helloworld/sonal")
 print(response.json())
+
+response = requests.get(BASE_URL + "helloworld/unknown")
+print(response.status_code, response.json())
+
+# A name padded with NUL characters isn't the name it starts with
+response = requests.get(BASE_URL + "helloworld/sonal%00")
+print(response.status_code, response.json())
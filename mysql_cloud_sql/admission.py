@@ -0,0 +1,218 @@
+import math
+import threading
+import time
+from collections import deque
+
+from flask import g, request
+from flask_restful.representations.json import output_json
+
+from metrics import LATENCY_BUCKETS, Counter, Gauge, Histogram
+
+# Weight of the latest request in the moving average of the time requests
+# hold their slot, which the waits of queued requests are estimated from.
+SERVICE_TIME_WEIGHT = 0.2
+
+# Status code and message of the response of a rejected request, by the
+# reason it was rejected for.
+REJECTIONS = {
+    'client_limit': (429, 'Too many concurrent requests from this client, please retry later'),
+    'queue_full': (503, 'The server is overloaded, please retry later'),
+    'deadline': (503, 'The server is overloaded, please retry later'),
+    'timeout': (503, 'The server is overloaded, please retry later')
+}
+
+
+class Limiter:
+    """The slots and the queue shared by the endpoints of an
+    AdmissionController. Only accessed with the lock of the owning
+    AdmissionController held.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        # Highest number of requests which have held a slot at the same time
+        self.peak_in_flight = 0
+        # Events of the queued requests, in order of arrival
+        self.queue = deque()
+        self.service_time = None
+
+
+class AdmissionController:
+    """Limits the number of requests to the given endpoints of a Flask app
+    which are handled at the same time, so that when the database slows
+    down the excess requests fail fast instead of piling up, each holding
+    a thread while waiting for a connection until they all time out.
+
+    The endpoints share max_concurrency slots, i.e. at most that many
+    requests are handled at a time across all of them, which should match
+    the size of the connection pool they draw from. The requests beyond
+    that wait their turn in a single queue of at most max_queue requests,
+    for up to queue_timeout seconds. A request is rejected with
+    503 Service Unavailable if the queue is full, if it's expected to wait
+    longer than queue_timeout (going by the number of requests ahead of it
+    and the moving average of the time they take) or once it has waited
+    that long. If max_per_client is set, a client with that many requests
+    running or queued across the endpoints is rejected with 429 Too Many
+    Requests. Clients are told apart by their address, or by the value of
+    client_header if it's set (by a proxy the app trusts). Every rejection
+    has a Retry-After header estimating when a slot will be free.
+
+    A request holds its slot until its context is torn down, so the time
+    spent streaming a response counts.
+
+    The number of requests queued and in flight, the time spent in the
+    queue and the rejections are returned by stats() and by collect(), as
+    snapshots of metrics (see RequestMetrics.add_collector).
+    """
+
+    def __init__(self, app=None, endpoints=(), max_concurrency=8, max_queue=16, queue_timeout=1.0,
+                 max_per_client=None, client_header=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+        self.client_header = client_header
+        self._lock = threading.Lock()
+        self._endpoints = frozenset(endpoints)
+        self._limiter = Limiter()
+        # Number of requests running or queued, by client
+        self._clients = {}
+
+        self.queue_depth = Gauge('admission_queue_depth', 'Number of requests waiting for a slot.', ())
+        self.in_flight = Gauge('admission_in_flight_requests', 'Number of requests holding a slot.', ())
+        self.queue_wait = Histogram(
+            'admission_queue_wait_seconds', 'Time admitted requests waited for a slot.',
+            ('endpoint',), LATENCY_BUCKETS
+        )
+        self.rejections = Counter(
+            'admission_rejected_requests_total', 'Number of requests shed instead of being handled.',
+            ('endpoint', 'reason')
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the hooks admitting and releasing the requests of the app."""
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def stats(self):
+        """Return a dict containing the configuration of the controller,
+        along with the requests in flight (now and at the peak) and queued
+        across the endpoints, the average time taken by a request and the
+        number of rejections of every endpoint.
+        """
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'max_per_client': self.max_per_client,
+                'in_flight': self._limiter.in_flight,
+                'peak_in_flight': self._limiter.peak_in_flight,
+                'queued': len(self._limiter.queue),
+                'average_service_time': self._limiter.service_time or 0.0,
+                'endpoints': {
+                    endpoint: {
+                        'rejected': {reason: self.rejections.get((endpoint, reason)) for reason in REJECTIONS}
+                    }
+                    for endpoint in sorted(self._endpoints)
+                }
+            }
+
+    def collect(self):
+        """Return the snapshots of the metrics of the controller."""
+        with self._lock:
+            self.queue_depth.set((), len(self._limiter.queue))
+            self.in_flight.set((), self._limiter.in_flight)
+            metrics = [self.queue_depth, self.in_flight, self.queue_wait, self.rejections]
+            return [metric.snapshot() for metric in metrics]
+
+    def _before_request(self):
+        endpoint = request.url_rule.endpoint if request.url_rule else None
+        if endpoint not in self._endpoints:
+            return None
+        limiter = self._limiter
+
+        client = request.headers.get(self.client_header) if self.client_header else None
+        client = client or request.remote_addr
+        started = time.perf_counter()
+
+        with self._lock:
+            if self.max_per_client and self._clients.get(client, 0) >= self.max_per_client:
+                return self._reject(endpoint, 'client_limit')
+            # Slots are handed over to the queued requests as they're freed,
+            # so there is never a free slot while requests are queued.
+            if limiter.in_flight < self.max_concurrency:
+                limiter.in_flight += 1
+                limiter.peak_in_flight = max(limiter.peak_in_flight, limiter.in_flight)
+                admitted = None
+            elif len(limiter.queue) >= self.max_queue:
+                return self._reject(endpoint, 'queue_full')
+            elif self._expected_wait(len(limiter.queue) + 1) > self.queue_timeout:
+                return self._reject(endpoint, 'deadline')
+            else:
+                admitted = threading.Event()
+                limiter.queue.append(admitted)
+            self._clients[client] = self._clients.get(client, 0) + 1
+
+        if admitted is not None and not admitted.wait(self.queue_timeout):
+            with self._lock:
+                # The slot may have been handed over since the wait timed out
+                if not admitted.is_set():
+                    limiter.queue.remove(admitted)
+                    self._release_client(client)
+                    return self._reject(endpoint, 'timeout')
+
+        now = time.perf_counter()
+        with self._lock:
+            self.queue_wait.observe((endpoint,), now - started)
+        g.admission = (endpoint, client, now)
+        return None
+
+    def _teardown_request(self, error=None):
+        admission = g.pop('admission', None)
+        if admission is None:
+            return
+        endpoint, client, admitted_at = admission
+        limiter = self._limiter
+        service_time = time.perf_counter() - admitted_at
+
+        with self._lock:
+            if limiter.service_time is None:
+                limiter.service_time = service_time
+            else:
+                limiter.service_time += SERVICE_TIME_WEIGHT * (service_time - limiter.service_time)
+            self._release_client(client)
+            if limiter.queue:
+                limiter.queue.popleft().set()
+            else:
+                limiter.in_flight -= 1
+
+    def _expected_wait(self, position):
+        """Return the number of seconds the request at the given position
+        (from 1) of the queue is expected to wait for a slot. Must be called
+        with the lock held.
+        """
+        if self._limiter.service_time is None:
+            return 0.0
+        return math.ceil(position / self.max_concurrency) * self._limiter.service_time
+
+    def _release_client(self, client):
+        """Must be called with the lock held."""
+        count = self._clients.pop(client) - 1
+        if count:
+            self._clients[client] = count
+
+    def _reject(self, endpoint, reason):
+        """Return the response rejecting a request, like the ones of
+        flask_restful.abort. Must be called with the lock held.
+        """
+        self.rejections.inc((endpoint, reason))
+        status, message = REJECTIONS[reason]
+        if reason == 'client_limit':
+            retry_after = self._limiter.service_time or 0.0
+        else:
+            retry_after = self._expected_wait(len(self._limiter.queue) + 1)
+        headers = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+        return output_json({'error_code': status, 'error_msg': message}, status, headers)
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel used to tell apart a missing entry from a cached value.
+_MISSING = object()
+
+
+class LRUCache:
+    """A thread-safe, size bounded cache which evicts the least recently
+    used entry once it is full and treats entries older than 'ttl' seconds
+    as expired.
+
+    Keeps count of hits, misses, evictions, expirations and invalidations
+    so that the size and TTL of the cache can be tuned. A cache with a
+    max_size of 0 is disabled i.e., it never stores anything.
+
+    If a secondary_key function is given, the entries can also be invalidated
+    by the secondary key it returns for their values (e.g. the ID of a record
+    cached by its name) using invalidate_secondary(). Several entries may have
+    the same secondary key (e.g. a record cached under two spellings of its
+    name which the database treats as equal) and are all invalidated together.
+
+    If a single_flight (see singleflight.py) is given, concurrent loads of
+    the same key by get_or_load() are coalesced into one.
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0, clock=time.monotonic, secondary_key=None, single_flight=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._secondary_key = secondary_key
+        self._single_flight = single_flight
+        self._entries = OrderedDict()
+        self._keys_by_secondary = {}
+        self._lock = threading.Lock()
+        # Incremented on every invalidation, so that a value loaded from the
+        # database before a write isn't cached after the write invalidated it.
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Return the value cached for the given key, or default if it
+        isn't cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        """Cache the value for the given key, evicting the least recently
+        used entries if the cache is full.
+
+        If a generation returned by current_generation() is given, the value
+        is only cached if nothing has been invalidated since then.
+        """
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, value)
+            if self._secondary_key is not None:
+                self._keys_by_secondary.setdefault(self._secondary_key(value), set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def current_generation(self):
+        """Return a token to be passed to set() when caching a value
+        which was loaded after calling this method.
+        """
+        with self._lock:
+            return self._generation
+
+    def get_or_load(self, key, loader):
+        """Return the value cached for the given key and if it isn't cached,
+        call loader() to load it and cache the result, unless it's None.
+
+        With a single_flight, concurrent misses of the same key share a
+        single call to loader(). A miss only joins a load which started after
+        the last invalidation, so it never returns a value older than a write
+        which invalidated it before the miss.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        generation = self.current_generation()
+        if self._single_flight is not None:
+            value = self._single_flight.do((key, generation), loader)
+        else:
+            value = loader()
+        if value is not None:
+            self.set(key, value, generation)
+        return value
+
+    def invalidate(self, *keys):
+        """Remove the entries for the given keys from the cache."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._remove(key):
+                    self.invalidations += 1
+
+    def invalidate_secondary(self, *secondary_keys):
+        """Remove the entries whose values have the given secondary keys."""
+        with self._lock:
+            self._generation += 1
+            for secondary_key in secondary_keys:
+                for key in self._keys_by_secondary.pop(secondary_key, ()):
+                    if self._remove(key):
+                        self.invalidations += 1
+
+    def clear(self):
+        """Remove all the entries from the cache."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys_by_secondary.clear()
+
+    def _remove(self, key):
+        """Remove the entry for the given key, along with its secondary key,
+        and return whether it existed. Must be called with the lock held.
+        """
+        entry = self._entries.pop(key, _MISSING)
+        if entry is _MISSING:
+            return False
+
+        if self._secondary_key is not None:
+            secondary_key = self._secondary_key(entry[1])
+            keys = self._keys_by_secondary.get(secondary_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_secondary[secondary_key]
+        return True
+
+    def stats(self):
+        """Return a dict containing the configuration, the current size
+        and the counters of the cache.
+        """
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import socket
+import threading
+
+from prefork import CHANNEL_FD_ENV, MAX_MESSAGE_SIZE, RESET_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+RESET_TOPIC = json.loads(RESET_MESSAGE)[0]
+
+
+class InvalidationChannel:
+    """Keeps the per-process caches of the worker processes of prefork.py
+    consistent with each other.
+
+    A worker which writes a row invalidates its own caches and publishes a
+    message on a topic (e.g. the ID of the row), which the master process
+    forwards to every other worker. Their channels pass it on, on a
+    background thread, to the handler subscribed to the topic. A worker which
+    missed messages resets everything instead, with the reset functions given
+    along with the handlers.
+
+    Outside of a worker of prefork.py there are no other workers, and
+    publishing does nothing.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._resets = []
+        self._socket = None
+
+        self.published = 0
+        self.received = 0
+        self.resets = 0
+        self.failures = 0
+
+        # The channel of a worker is set up when the worker is forked from
+        # the master, or here if the app is only imported by the worker.
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._connect)
+        self._connect()
+
+    def subscribe(self, topic, handler, reset=None):
+        """Call handler(payload) with the payload of every message published
+        on the topic by another worker, and reset() if messages were missed.
+        """
+        self._handlers[topic] = handler
+        if reset is not None:
+            self._resets.append(reset)
+
+    def publish(self, topic, payload):
+        """Send a message with a JSON serializable payload to the other workers.
+
+        A message which can't be sent (e.g. because it's too large) is
+        replaced by a reset of the other workers.
+        """
+        if self._socket is None:
+            return
+
+        message = json.dumps([topic, payload], separators=(',', ':')).encode()
+        if len(message) > MAX_MESSAGE_SIZE:
+            message = RESET_MESSAGE
+        try:
+            self._socket.send(message)
+        except OSError:
+            logger.exception('Failed to publish a message on %r', topic)
+            self.failures += 1
+            return
+        self.published += 1
+
+    def stats(self):
+        """Return a dict containing the counters of the channel."""
+        return {
+            'connected': self._socket is not None,
+            'published': self.published,
+            'received': self.received,
+            'resets': self.resets,
+            'failures': self.failures
+        }
+
+    def _connect(self):
+        """Connect to the master if this process is a worker being started."""
+        fd = os.environ.pop(CHANNEL_FD_ENV, None)
+        if fd is None:
+            self._socket = None
+            return
+
+        self._socket = socket.socket(fileno=int(fd))
+        self.published = self.received = self.resets = self.failures = 0
+        threading.Thread(target=self._listen, args=(self._socket,), name='invalidation-channel', daemon=True).start()
+
+    def _listen(self, channel):
+        """Deliver the messages received from the master until it's gone."""
+        while True:
+            try:
+                message = channel.recv(MAX_MESSAGE_SIZE)
+            except OSError:
+                return
+            if not message:
+                return
+
+            try:
+                topic, payload = json.loads(message)
+                if topic == RESET_TOPIC:
+                    self.resets += 1
+                    for reset in self._resets:
+                        reset()
+                else:
+                    self.received += 1
+                    handler = self._handlers.get(topic)
+                    if handler is not None:
+                        handler(payload)
+            except Exception:
+                logger.exception('Failed to handle a message of the invalidation channel')
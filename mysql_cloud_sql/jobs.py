@@ -0,0 +1,174 @@
+import json
+import logging
+import threading
+import time
+import uuid
+
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+
+class JobLost(Exception):
+    """Raised when a job has been taken over by another process, which
+    resumed it after it stopped saving its progress for too long.
+    """
+
+
+class Job:
+    """A unit of work running on a background thread, whose status and
+    progress are stored in a row of the jobs table (see
+    migrations/005_add_jobs.sql).
+    """
+
+    def __init__(self, table, row):
+        self._table = table
+        self.id = row['id']
+        self.name = row['name']
+        self.status = row['status']
+        self.progress = json.loads(row['progress'])
+        self.error = row['error']
+        self.owner = row['owner']
+        self.started_at = row['started_at']
+        self.heartbeat_at = row['heartbeat_at']
+        self.finished_at = row['finished_at']
+
+    def save_progress(self, session, **progress):
+        """Update the progress of the job in the current transaction of the
+        session, so that it's committed along with the work it describes.
+
+        Raise JobLost if the job has been taken over by another process, in
+        which case the transaction must be rolled back.
+        """
+        self.progress.update(progress)
+        self.heartbeat_at = time.time()
+        saved = session.execute(
+            self._table.update()
+            .where(and_(self._table.c.id == self.id, self._table.c.owner == self.owner))
+            .values(progress=json.dumps(self.progress), heartbeat_at=self.heartbeat_at)
+        ).rowcount
+        if not saved:
+            raise JobLost(f'Job {self.id} ({self.name}) has been taken over by another process')
+
+    def to_dict(self):
+        """Return a dict describing the job which can be serialized into JSON."""
+        return {
+            'job_id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobRunner:
+    """Runs jobs on background threads and stores their status and progress
+    in a table of the database, so that every process serving the app knows
+    about the jobs started by the others.
+
+    At most one job of a given name runs at a time across the processes.
+    A running job saves its progress along with every unit of work it
+    commits. A job which hasn't saved its progress for stale_after seconds
+    (e.g. because the process running it was stopped) is taken over by the
+    next process asked about it, which calls its target again with the
+    saved progress to resume it from there. Finished jobs are forgotten
+    after keep_finished seconds.
+    """
+
+    def __init__(self, engine, table, stale_after=60.0, keep_finished=86400.0):
+        self.engine = engine
+        self.table = table
+        self.stale_after = stale_after
+        self.keep_finished = keep_finished
+        self._targets = {}
+
+    def register(self, name, target):
+        """Register target(job) as the function running the jobs of the given name."""
+        self._targets[name] = target
+
+    def start(self, name):
+        """Start a job of the given name on a background thread and return
+        it. If a job with the same name is already running, return that job
+        instead of starting another one.
+        """
+        now = time.time()
+        with self.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.finished_at < now - self.keep_finished))
+
+        while True:
+            with self.engine.connect() as connection:
+                row = connection.execute(
+                    self.table.select().where(self.table.c.running_name == name)
+                ).first()
+            if row is not None:
+                return self._take_over_if_stale(Job(self.table, row))
+
+            row = {
+                'id': uuid.uuid4().hex, 'name': name, 'running_name': name, 'status': 'running',
+                'progress': '{}', 'error': None, 'owner': uuid.uuid4().hex,
+                'started_at': now, 'heartbeat_at': now, 'finished_at': None
+            }
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(self.table.insert().values(row))
+            except IntegrityError:
+                # Another process has just started a job of that name
+                continue
+
+            job = Job(self.table, row)
+            self._spawn(job)
+            return job
+
+    def get(self, job_id):
+        """Return the job with the given ID or None if it isn't known."""
+        with self.engine.connect() as connection:
+            row = connection.execute(self.table.select().where(self.table.c.id == job_id)).first()
+        return self._take_over_if_stale(Job(self.table, row)) if row is not None else None
+
+    def _take_over_if_stale(self, job):
+        """Resume the job in this process if it's running but hasn't saved
+        its progress for stale_after seconds, and return it.
+        """
+        if job.status != 'running' or job.heartbeat_at >= time.time() - self.stale_after:
+            return job
+
+        owner, heartbeat_at = uuid.uuid4().hex, time.time()
+        with self.engine.begin() as connection:
+            taken_over = connection.execute(
+                self.table.update()
+                .where(and_(self.table.c.id == job.id, self.table.c.owner == job.owner))
+                .values(owner=owner, heartbeat_at=heartbeat_at)
+            ).rowcount
+        # Another process may have taken it over first
+        if taken_over:
+            logger.warning('Resuming job %s (%s) with progress %s', job.id, job.name, job.progress)
+            job.owner, job.heartbeat_at = owner, heartbeat_at
+            self._spawn(job)
+        return job
+
+    def _spawn(self, job):
+        thread = threading.Thread(target=self._run, args=(job,), name=f'job-{job.name}', daemon=True)
+        thread.start()
+
+    def _run(self, job):
+        """Run the target of the job and record how it finished."""
+        try:
+            self._targets[job.name](job)
+            self._finish(job, 'completed')
+        except JobLost:
+            logger.warning('Job %s (%s) has been taken over by another process', job.id, job.name)
+        except Exception as error:
+            logger.exception('Job %s (%s) failed', job.id, job.name)
+            self._finish(job, 'failed', str(error))
+
+    def _finish(self, job, status, error=None):
+        """Record the final status of the job, unless another process took it over."""
+        with self.engine.begin() as connection:
+            connection.execute(
+                self.table.update()
+                .where(and_(self.table.c.id == job.id, self.table.c.owner == job.owner))
+                .values(status=status, error=error, running_name=None, finished_at=time.time())
+            )
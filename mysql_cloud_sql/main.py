@@ -1,10 +1,36 @@
+import base64
+import hashlib
+import json
 import os
+import sys
+import time
+from contextlib import contextmanager
+from itertools import chain
 
+import click
 # from dotenv import load_dotenv
-from flask import Flask
-from flask_restful import Api, Resource, reqparse, abort, fields, marshal_with
+from flask import Flask, Response, request, stream_with_context
+from flask.cli import AppGroup
+from flask_restful import Api, Resource, reqparse, abort, fields, inputs
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.automap import automap_base
+from werkzeug.http import quote_etag
+
+import schema_snapshot
+from admission import AdmissionController
+from bulk import FORMATS, Progress, batched, detect_format, read_records, write_records
+from cache import LRUCache
+from compression import ResponseCompressor
+from invalidation import InvalidationChannel
+from jobs import JobRunner
+from metrics import RequestMetrics
+from pool import TimedQueuePool
+from serializer import Serializer, json_separators, uses_restful_json
+from singleflight import SingleFlight
+from upsert import upsert
+from validation import Field, RequestValidator
 
 # Not used in deployment
 # Configure dotenv to read environment variables from .env file
@@ -24,33 +50,221 @@ DATABASE_NAME = os.getenv('DATABASE_NAME')
 # SQLAlchemy Configuration
 
 # Using the official MySQL Driver for Python (developed by Oracle), 
-# mysqlconnector, to connect to the remote MySQL database 
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+mysqlconnector://{DB_USER}:{DB_USER_PWD}@{DB_PUBLIC_IP_ADDRESS}/{DATABASE_NAME}?unix_socket=/cloudsql/{CONNECTION_NAME}'
+# mysqlconnector, to connect to the remote MySQL database. DATABASE_URI 
+# overrides it with any other database having the same members table, e.g. 
+# the SQLite stand-in used by benchmarks/load.py.
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI') or f'mysql+mysqlconnector://{DB_USER}:{DB_USER_PWD}@{DB_PUBLIC_IP_ADDRESS}/{DATABASE_NAME}?unix_socket=/cloudsql/{CONNECTION_NAME}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+# Write JSON documents without whitespace and with non-ASCII characters
+# unescaped, instead of the output of json.dumps with its default settings.
+app.config['COMPACT_JSON'] = os.getenv('COMPACT_JSON', 'false').lower() in ('1', 'true', 'yes')
+
+# Connection Pool Configuration
+
+# Number of connections kept open, number of additional connections which can
+# be opened under load, number of seconds a caller waits for a connection 
+# before giving up and the maximum age (in seconds) of a connection before it's 
+# replaced, which should be lower than the wait_timeout of the MySQL server.
+# Pre-ping tests every connection with a lightweight query when it's checked
+# out, so that connections closed by the server are replaced transparently.
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'poolclass': TimedQueuePool,
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 2)),
+    'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+}
+
+# Schema Configuration
+
+# Path of a snapshot of the schema of the database. When set, the schema is
+# loaded from the snapshot at start up instead of being reflected from the
+# database, which saves a connection and a round trip per table on every cold 
+# start, and the snapshot is compared against the live schema in the background
+# SCHEMA_SNAPSHOT_CHECK_DELAY seconds later.
+SCHEMA_SNAPSHOT_PATH = os.getenv('SCHEMA_SNAPSHOT_PATH')
+SCHEMA_SNAPSHOT_CHECK_DELAY = float(os.getenv('SCHEMA_SNAPSHOT_CHECK_DELAY', 5))
+
+# Listing Configuration
+
+# Number of rows fetched from the database in a single round trip while
+# streaming the members table to the client.
+MEMBERS_BATCH_SIZE = int(os.getenv('MEMBERS_BATCH_SIZE', 500))
+# Default and maximum number of members returned in a single page when
+# the client asks for a paginated listing, and of changes returned in a
+# single page of the change log.
+MEMBERS_DEFAULT_PAGE_SIZE = int(os.getenv('MEMBERS_DEFAULT_PAGE_SIZE', 100))
+MEMBERS_MAX_PAGE_SIZE = int(os.getenv('MEMBERS_MAX_PAGE_SIZE', 1000))
+
+# Whether the name and email columns of the members table use a
+# case-insensitive collation, in which case "Joe" and "joe" refer to the same
+# member. It's the case of the default collation of the table (see
+# migrations/002_add_members_unique_indexes.sql); set it to false if the
+# columns have been switched to a binary collation.
+MEMBERS_CASE_INSENSITIVE = os.getenv('MEMBERS_CASE_INSENSITIVE', 'true').lower() in ('1', 'true', 'yes')
+
+# Binary collation of each supported dialect, which the case-sensitive
+# searches compare names in, whatever the collation of the name column.
+BINARY_COLLATIONS = {'mysql': 'utf8mb4_bin', 'sqlite': 'BINARY'}
+
+# Default and maximum number of members returned in a single page of the
+# results of a search by name.
+MEMBERS_SEARCH_DEFAULT_LIMIT = int(os.getenv('MEMBERS_SEARCH_DEFAULT_LIMIT', 20))
+MEMBERS_SEARCH_MAX_LIMIT = int(os.getenv('MEMBERS_SEARCH_MAX_LIMIT', 100))
+# Length of the name column, which bounds the length of a search term
+MEMBER_NAME_MAX_LENGTH = 100
+
+# Number of members inserted by every transaction of `flask members import`
+MEMBERS_IMPORT_BATCH_SIZE = int(os.getenv('MEMBERS_IMPORT_BATCH_SIZE', 1000))
+
+# Number of members removed by every transaction of a bulk delete
+MEMBERS_DELETE_CHUNK_SIZE = int(os.getenv('MEMBERS_DELETE_CHUNK_SIZE', 1000))
+# Seconds after which a bulk delete which hasn't saved its progress is
+# resumed by another worker (see jobs.py), and seconds the status of a
+# finished bulk delete is kept for.
+JOBS_STALE_AFTER = float(os.getenv('JOBS_STALE_AFTER', 60))
+JOBS_KEEP_FINISHED = float(os.getenv('JOBS_KEEP_FINISHED', 86400))
+
+# Cache Configuration
+
+# Maximum number of members held by the cache (0 disables caching) and
+# the number of seconds after which a cached member expires.
+MEMBER_CACHE_SIZE = int(os.getenv('MEMBER_CACHE_SIZE', 10000))
+MEMBER_CACHE_TTL = float(os.getenv('MEMBER_CACHE_TTL', 300))
+# Concurrent cache misses of the same member (or GETs of it, if the cache is
+# disabled) share a single query, with at most MEMBER_LOAD_MAX_WAITERS requests
+# waiting for it.
+MEMBER_LOAD_MAX_WAITERS = int(os.getenv('MEMBER_LOAD_MAX_WAITERS', 100))
+
+# Metrics Configuration
+
+# Requests taking longer than this many seconds are logged along with their
+# SQL statements. Unset by default, which disables the slow request log.
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD')) if os.getenv('SLOW_REQUEST_THRESHOLD') else None
+
+# Admission Control Configuration
+
+# Maximum number of requests handled at the same time across the endpoints
+# querying the members tables (by default, as many as the pool has
+# connections), maximum number of requests waiting for one of them to finish
+# and the number of seconds a request may wait. Requests which would wait
+# longer are rejected right away with 503 and a Retry-After header instead.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY') or (
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] + app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow']
+))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 16))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2))
+# Maximum number of requests a single client can have running or waiting
+# across these endpoints, beyond which it's rejected with 429 (unset by
+# default, which disables the limit). Clients are told apart by their address,
+# or by the header named by ADMISSION_CLIENT_HEADER if it's set by the front
+# end (e.g. X-Appengine-User-IP on App Engine).
+ADMISSION_MAX_PER_CLIENT = int(os.getenv('ADMISSION_MAX_PER_CLIENT')) if os.getenv('ADMISSION_MAX_PER_CLIENT') else None
+ADMISSION_CLIENT_HEADER = os.getenv('ADMISSION_CLIENT_HEADER')
+
+# Compression Configuration
+
+# Responses of at least COMPRESSION_MIN_SIZE bytes, along with every streamed
+# listing of members, are compressed with gzip/deflate when the client accepts
+# it, at COMPRESSION_LEVEL (1 is the fastest, 9 gives the smallest output).
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 6))
+
+# Objects aren't expired on commit, so that returning a member that has just
+# been written doesn't cost another SELECT to reload it. Sessions only live
+# as long as a request, so they can't hold on to stale objects.
+db = SQLAlchemy(app, session_options={'expire_on_commit': False})
+
+# Worker processes forked from this one (e.g. by prefork.py) can't share the
+# connections it opened while loading the schema, so every worker starts with
+# a new pool.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: db.get_engine(app).dispose())
+
+# Latency and SQL statements of every request, per endpoint, exposed at /metrics
+request_metrics = RequestMetrics(app, slow_request_threshold=SLOW_REQUEST_THRESHOLD)
+
+response_compressor = ResponseCompressor(app, min_size=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVEL)
 
 # Using AutoMap to utilize tables already existing in the database
 # without the need to create our own Model classes.
-Base = automap_base()
-Base.prepare(db.engine, reflect=True)
+metadata, schema_snapshot_check = schema_snapshot.load_metadata(
+    db.engine, SCHEMA_SNAPSHOT_PATH, check_delay=SCHEMA_SNAPSHOT_CHECK_DELAY
+)
+Base = automap_base(metadata=metadata)
+Base.prepare()
 Member = Base.classes.members
+# Change log of the members table (see migrations/004_add_member_changes.sql)
+MemberChange = Base.classes.member_changes
+MemberChangeSequence = Base.classes.member_change_sequence
+
+# Queries loading members for the member cache, coalesced (see singleflight.py)
+member_loads = SingleFlight(max_waiters=MEMBER_LOAD_MAX_WAITERS)
+
+# Cache of the members served by GET requests, keyed by the name of the member
+# (see member_cache_key). Requests which modify a member invalidate the entries
+# of its ID, which is tracked as a secondary key, along with the entry of its new name,
+# in every worker process (see invalidate_member). A member may be cached under
+# several names which the collation of the database treats as equal (e.g.
+# "José" and "Jose"), and the entries of all of them are invalidated.
+member_cache = LRUCache(
+    max_size=MEMBER_CACHE_SIZE, ttl=MEMBER_CACHE_TTL, secondary_key=lambda member: member['_id'],
+    single_flight=member_loads
+)
+
+# Channel through which the worker processes of prefork.py tell each other
+# which members they have written (see invalidation.py).
+invalidation_channel = InvalidationChannel()
 
 # NOTE: We can't use query direcly on the classes mapped to tables in
 #       an existing database. To run queries, we need to use the
 #       query(mapped_table) on the db.session object.
 
-# Parse the arguments sent to POST & PUT requests for valid JSON objects
+# Parse the query string arguments sent to GET requests on the members table
+# which control pagination and the format of the listing.
+member_list_parser = reqparse.RequestParser()
+member_list_parser.add_argument('after_id', type=int, location='args', help='ID of the last member of the previous page')
+member_list_parser.add_argument('limit', type=int, location='args', help='Maximum number of members in a page')
+member_list_parser.add_argument('format', type=str, location='args', choices=('json', 'ndjson'), default='json', 
+    help='Format of the listing. Either json or ndjson'
+)
+
+# Parse the query string arguments sent to GET requests searching members by name
+member_search_parser = reqparse.RequestParser()
+member_search_parser.add_argument('q', type=str, location='args', required=True, 
+    help='Required. Name (or beginning of the name) of the members to search for'
+)
+member_search_parser.add_argument('prefix', type=inputs.boolean, location='args', default=False, 
+    help='Whether to match the names starting with q. Either true or false'
+)
+member_search_parser.add_argument('ci', type=inputs.boolean, location='args', default=False, 
+    help='Whether to ignore the case of the names. Either true or false'
+)
+member_search_parser.add_argument('limit', type=int, location='args', help='Maximum number of members in a page')
+member_search_parser.add_argument('cursor', type=str, location='args', help='next_cursor of the previous page')
+
+# Parse the query string arguments sent to GET requests on the change log of the members table
+member_changes_parser = reqparse.RequestParser()
+member_changes_parser.add_argument('since', type=int, location='args', default=0, 
+    help='Sequence number of the last change already seen (next_since of the previous page)'
+)
+member_changes_parser.add_argument('limit', type=int, location='args', help='Maximum number of changes in a page')
+
+# Validate the arguments sent to POST & PUT requests for valid JSON objects
 # required to pass data related to a single Member record.
-record_parser_for_post_put = reqparse.RequestParser()
-record_parser_for_post_put.add_argument('name', type=str, help='Required. Name of the new member', required=True)
-record_parser_for_post_put.add_argument('email', type=str, help='Required. Email ID of the new member', required=True)
+record_parser_for_post_put = RequestValidator({
+    'name': Field(str, required=True, help='Required. Name of the new member'),
+    'email': Field(str, required=True, help='Required. Email ID of the new member')
+})
 
-# Parse the arguments sent to PATCH requests for valid JSON objects
+# Validate the arguments sent to PATCH requests for valid JSON objects
 # required to pass data related to a single Member record.
-record_parser_for_patch = reqparse.RequestParser()
-record_parser_for_patch.add_argument('name', type=str, help='Name of the new member')
-record_parser_for_patch.add_argument('email', type=str, help='Email ID of the new member')
+record_parser_for_patch = RequestValidator({
+    'name': Field(str, help='Name of the new member'),
+    'email': Field(str, help='Email ID of the new member')
+})
 
 # Resource Fields to define the format to serialize a member object into JSON
 record_fields = {
@@ -59,44 +273,462 @@ record_fields = {
     'email': fields.String
 }
 
+# Serializers compiled from record_fields (see serializer.py) for members read
+# as dicts (e.g. from the member cache), as Member objects and as
+# (_id, name, email) tuples returned by queries of individual columns.
+member_serializer = Serializer(record_fields)
+member_object_serializer = Serializer(record_fields, access='attribute')
+member_row_serializer = Serializer(record_fields, access='index')
+# Serializer of the (name, email) of a member in the full listing of members
+member_entry_serializer = Serializer({'name': fields.String, 'email': fields.String}, access='index')
+# Serializer of the (seq, operation, member_id, name, email, changed_at) rows of the change log
+member_change_serializer = Serializer({
+    'seq': fields.Integer,
+    'operation': fields.String,
+    '_id': fields.Integer,
+    'name': fields.String,
+    'email': fields.String,
+    'changed_at': fields.Integer
+}, access='index')
+
+
+def current_timestamp():
+    """Return the current time as the number of microseconds since the epoch,
+    which is stored in the updated_at column of a member whenever it's modified.
+    """
+    return time.time_ns() // 1000
+
+
+def member_etag(user_id, updated_at):
+    """Return the (unquoted) ETag of a member last modified at updated_at."""
+    return f'{user_id}-{updated_at}'
+
+
+def members_table_etag():
+    """Return the (unquoted) ETag of the listing of the members table
+    requested by the current request.
+
+    The ETag is derived from the sequence number of the last change of the
+    members table (see record_member_changes), which every insert, update
+    or delete increments, so it's read from a single row whatever the size
+    of the table. The query string is part of the ETag because every page
+    and format is a separate representation.
+    """
+    last_seq = db.session.query(MemberChangeSequence.last_seq).filter_by(id=1).scalar()
+
+    fingerprint = f'{last_seq}-{request.query_string.decode()}'
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def normalize_name(name):
+    """Return the normalized form of a name, which is stored along with
+    the name in the name_normalized column (see 
+    migrations/003_add_members_name_normalized.sql) and compared against by
+    the case-insensitive searches of members.
+    """
+    return name.lower()
+
+
+def prefix_upper_bound(prefix):
+    """Return the smallest string greater than every string starting with
+    the given prefix in code point order, or None if there is no such string.
+
+    The names starting with a prefix are then found with a range scan of
+    an index (prefix <= name < bound) rather than a LIKE, whose pattern
+    characters would have to be escaped and which SQLite doesn't serve
+    from an index of a case-sensitive column.
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+
+    code_point = ord(prefix[-1]) + 1
+    # Surrogates can't be encoded, the next code point is the first after them
+    if 0xD800 <= code_point <= 0xDFFF:
+        code_point = 0xE000
+    return prefix[:-1] + chr(code_point)
+
+
+def name_conditions(column, term, prefix=False):
+    """Return the conditions matching the values of a column equal to the
+    term, or starting with it if prefix is True, in the order of the
+    collation of the column.
+    """
+    if not prefix:
+        return [column == term]
+
+    conditions = [column >= term]
+    upper_bound = prefix_upper_bound(term)
+    if upper_bound is not None:
+        conditions.append(column < upper_bound)
+    return conditions
+
+
+def encode_search_cursor(key, user_id):
+    """Return the cursor of the page of search results following the
+    member with the given search key (normalized name) and ID.
+    """
+    return base64.urlsafe_b64encode(json.dumps([key, user_id]).encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    """Return the (key, user_id) encoded in a cursor returned by
+    encode_search_cursor, raising a ValueError if it's invalid.
+    """
+    try:
+        key, user_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+
+    if not isinstance(key, str) or not isinstance(user_id, int):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return key, user_id
+
+
+def members_page_response(page, cursor_field, cursor):
+    """Return the response containing a page of members, given as rows
+    starting with (_id, name, email), along with the cursor of the next
+    page (None for the last page) named cursor_field.
+    """
+    if uses_restful_json():
+        members = [dict(zip(record_fields, row)) for row in page]
+        return api.make_response({'members': members, cursor_field: cursor}, 200)
+
+    item_separator, key_separator = json_separators()
+    document = (
+        f'{{"members"{key_separator}{member_row_serializer.to_json_array(page)}{item_separator}'
+        f'"{cursor_field}"{key_separator}{json.dumps(cursor)}}}\n'
+    )
+    return app.response_class(document, status=200, mimetype='application/json')
+
+
+def record_member_changes(operation, members, changed_at):
+    """Append a change of every given member to the change log, as part
+    of the transaction of the current session. Must be called right before
+    the transaction is committed.
+
+    The operation is 'upsert' for members which have been created or
+    modified, given as (_id, name, email) rows, or 'delete' for deleted
+    members, given as IDs.
+
+    The sequence numbers of the changes are reserved by incrementing the
+    row of member_change_sequence, whose lock is held until the commit so
+    that changes are committed in the order of their sequence numbers.
+    """
+    if not members:
+        return
+
+    sequence = db.session.query(MemberChangeSequence).filter_by(id=1)
+    sequence.update(
+        {MemberChangeSequence.last_seq: MemberChangeSequence.last_seq + len(members)}, synchronize_session=False
+    )
+    first_seq = sequence.with_entities(MemberChangeSequence.last_seq).scalar() - len(members) + 1
+
+    if operation == 'delete':
+        members = [(member_id, None, None) for member_id in members]
+    db.session.execute(MemberChange.__table__.insert(), [
+        {'seq': seq, 'member_id': member_id, 'operation': operation, 'name': name, 'email': email, 'changed_at': changed_at}
+        for seq, (member_id, name, email) in enumerate(members, first_seq)
+    ])
+
+
+def member_changes_response(page, next_since, has_more):
+    """Return the response containing a page of the change log, given as
+    (seq, operation, member_id, name, email, changed_at) rows, along with
+    the sequence number to pass as 'since' to get the next page.
+    """
+    if uses_restful_json():
+        changes = [dict(zip(member_change_serializer.fields, row)) for row in page]
+        return api.make_response({'changes': changes, 'next_since': next_since, 'has_more': has_more}, 200)
+
+    item_separator, key_separator = json_separators()
+    document = (
+        f'{{"changes"{key_separator}{member_change_serializer.to_json_array(page)}{item_separator}'
+        f'"next_since"{key_separator}{next_since}{item_separator}'
+        f'"has_more"{key_separator}{json.dumps(has_more)}}}\n'
+    )
+    return app.response_class(document, status=200, mimetype='application/json')
+
+
+def member_cache_key(name):
+    """Return the key of the member with the given name in the member cache.
+
+    Names are case folded when the database compares them case-insensitively,
+    so that the lookups of "Joe" and "joe" share (and invalidate) the same entry.
+    """
+    return name.casefold() if MEMBERS_CASE_INSENSITIVE else name
+
+
+def invalidate_member(user_id=None, name=None):
+    """Remove the cached entries of a member, by ID and/or by name, from the
+    member cache of this process and, through the invalidation channel, of
+    every other worker process.
+    """
+    invalidate_cached_member(user_id, name)
+    invalidation_channel.publish('member', [user_id, name])
+
+
+def invalidate_cached_member(user_id=None, name=None):
+    """Remove the cached entries of a member from the member cache of this process."""
+    if user_id is not None:
+        member_cache.invalidate_secondary(user_id)
+    if name is not None:
+        member_cache.invalidate(member_cache_key(name))
+
+
+def clear_member_cache():
+    """Remove every member from the member cache of every worker process."""
+    member_cache.clear()
+    invalidation_channel.publish('members_cleared', None)
+
+
+# Apply the writes made by the other worker processes
+invalidation_channel.subscribe('member', lambda payload: invalidate_cached_member(*payload), reset=member_cache.clear)
+invalidation_channel.subscribe('members_cleared', lambda payload: member_cache.clear())
+
+# Runs the bulk deletes of the members table in the background and tracks
+# them in the jobs table (see migrations/005_add_jobs.sql)
+job_runner = JobRunner(db.engine, metadata.tables['jobs'], stale_after=JOBS_STALE_AFTER, keep_finished=JOBS_KEEP_FINISHED)
+
+
+@contextmanager
+def abort_on_conflict(error_msg):
+    """Context manager which commits the current session at the end of
+    the block. If the statements executed in the block or the commit violate
+    the unique constraints on the name or the email of members, the session
+    is rolled back and the request is aborted with a 409 error and the given message.
+    """
+    try:
+        yield
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, error_code=409, error_msg=error_msg)
+
+
+def iter_member_batches(after_id=None, batch_size=MEMBERS_BATCH_SIZE):
+    """Generator which walks the members table in ascending order of ID
+    and yields the rows as lists of (_id, name, email) tuples containing
+    at most batch_size rows each.
+
+    Uses keyset pagination i.e., every batch is fetched with its own query
+    starting right after the last ID of the previous batch. This means that
+    only a single batch is held in memory at any time and no query has to
+    skip over rows like an OFFSET would, irrespective of the size of the table.
+    """
+    while True:
+        query = db.session.query(Member._id, Member.name, Member.email)
+        if after_id is not None:
+            query = query.filter(Member._id > after_id)
+        batch = query.order_by(Member._id).limit(batch_size).all()
+
+        if batch:
+            yield batch
+        if len(batch) < batch_size:
+            return
+
+        after_id = batch[-1]._id
+
+
+def delete_members_in_chunks(job, chunk_size=MEMBERS_DELETE_CHUNK_SIZE):
+    """Delete all the members which existed when the job was started, 
+    committing every chunk of chunk_size members as a separate transaction.
+
+    Chunks are consecutive ranges of IDs found by walking the primary key
+    index, so gaps in the IDs never lead to empty chunks. Keeping every
+    transaction small avoids holding locks on the whole table and building up
+    a large undo log. Every chunk deletes the IDs it has found, records
+    their deletion in the change log and saves the progress of the job in
+    the same transaction, so that a job resumed by another process carries
+    on right after the last chunk committed.
+    """
+    with app.app_context():
+        if 'max_id' in job.progress:
+            max_id, last_id = job.progress['max_id'], job.progress['last_id']
+        else:
+            max_id = db.session.query(func.max(Member._id)).scalar()
+            last_id = None
+            job.save_progress(db.session, deleted=0, chunks=0, last_id=None, max_id=max_id)
+            db.session.commit()
+
+        while max_id is not None:
+            in_range = [Member._id <= max_id]
+            if last_id is not None:
+                in_range.append(Member._id > last_id)
+
+            ids = [
+                row._id for row in
+                db.session.query(Member._id).filter(*in_range).order_by(Member._id).limit(chunk_size)
+            ]
+            boundary = ids[-1] if len(ids) == chunk_size else None
+
+            deleted = 0
+            if ids:
+                deleted = db.session.query(Member).filter(Member._id.in_(ids)).delete(synchronize_session=False)
+                record_member_changes('delete', ids, current_timestamp())
+            last_id = boundary if boundary is not None else max_id
+            job.save_progress(
+                db.session, deleted=job.progress['deleted'] + deleted, chunks=job.progress['chunks'] + 1, last_id=last_id
+            )
+            db.session.commit()
+            clear_member_cache()
+
+            if boundary is None:
+                break
+
+
+job_runner.register('delete_all_members', delete_members_in_chunks)
+
 
 class MemberEntity(Resource):
     """Resource class to handle requests made to the 'members' table 
     in the database at the specified URLs:
-        1. /members/all
+        1. /members/all[?after_id=<int>&limit=<int>&format=json|ndjson]
         2. /members/new
         3. /members/delete
 
     Handles the following requests at the following endpoints:
-        1. GET    - Get all the members.
+        1. GET    - Get all the members (optionally one page at a time).
         2. POST   - Create a new member.
-        3. DELETE - Delete all the members.
+        3. DELETE - Delete all the members (as a background job).
     """
     
     def get(self):
         """Handles GET requests to the resource.
 
         Return code 200 along with a JSON response containing details
-        about all the members stored in the database.
+        about all the members stored in the database. The response is
+        streamed to the client while the members are read from the database
+        in batches, so the memory used by a request doesn't grow with the 
+        size of the table.
+
+        The listing can be controlled with the following query parameters:
+            1. after_id - Only list members with an ID greater than the given ID.
+            2. limit    - Return a single page of at most 'limit' members as
+                          {"members": [...], "next_after_id": <int|null>}, 
+                          where next_after_id is the after_id of the next page.
+            3. format   - 'ndjson' streams every member as a separate JSON
+                          object on its own line instead.
+
+        In debug mode or when RESTFUL_JSON is set (see uses_restful_json),
+        the full listing is built in memory and written by flask_restful
+        instead, and every line of the NDJSON listing is written with the
+        RESTFUL_JSON settings, except for the indent.
+
+        Every response carries an ETag which changes whenever a member is
+        created, modified or deleted. If the request contains an If-None-Match
+        header matching it, return 304 without reading or serializing the members.
 
         Abort handling GET requests and return 404 if no members
-        exist in the database along with an error message.
+        exist in the database along with an error message. Return 400
+        if the given limit is outside the allowed range.
         """
-        result = db.session.query(Member).all()
+        list_args = member_list_parser.parse_args()
+        after_id = list_args['after_id']
+        limit = list_args['limit']
 
-        if not result:
+        if limit is not None and not 1 <= limit <= MEMBERS_MAX_PAGE_SIZE:
+            abort(400, error_code=400, 
+                error_msg=f'The limit should be between 1 and {MEMBERS_MAX_PAGE_SIZE}'
+            )
+
+        etag = members_table_etag()
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers={'ETag': quote_etag(etag)})
+
+        response = self._get_listing(list_args['format'], after_id, limit)
+        response.set_etag(etag)
+        return response
+
+    def _get_listing(self, list_format, after_id, limit):
+        """Return the response containing the listing of members in the
+        requested format.
+        """
+        if list_format == 'ndjson':
+            return self._stream_ndjson(after_id, limit)
+        if limit is not None or after_id is not None:
+            return self._get_page(after_id, limit or MEMBERS_DEFAULT_PAGE_SIZE)
+
+        batches = iter_member_batches()
+        first_batch = next(batches, None)
+
+        if first_batch is None:
             abort(404, error_code=404, error_msg='No member exist in the database')
 
-        members = {}
-        for record in result:
-            members[record._id] = {
-                'name': record.name, 
-                'email': record.email
+        if uses_restful_json():
+            members = {
+                _id: {'name': name, 'email': email}
+                for batch in chain([first_batch], batches) for _id, name, email in batch
             }
+            return api.make_response([members], 200)
+
+        def generate():
+            # Stream the same document ([{"<id>": {"name": ..., "email": ...}}])
+            # that used to be built in memory, one batch at a time.
+            item_separator, key_separator = json_separators()
+            to_json = member_entry_serializer.to_json
+            separator = ''
+            yield '[{'
+            for batch in chain([first_batch], batches):
+                chunk = []
+                for _id, name, email in batch:
+                    chunk.append(f'{separator}"{_id}"{key_separator}{to_json((name, email))}')
+                    separator = item_separator
+                yield ''.join(chunk)
+            yield '}]\n'
 
-        return [members], 200
+        return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
+    def _get_page(self, after_id, limit):
+        """Return a single page of at most 'limit' members having an ID
+        greater than after_id, along with the cursor for the next page.
+
+        One extra row is fetched to find out whether another page exists
+        without having to run a second query.
+        """
+        rows = next(iter_member_batches(after_id, batch_size=limit + 1), [])
+
+        if not rows and after_id is None:
+            abort(404, error_code=404, error_msg='No member exist in the database')
+
+        page = rows[:limit]
+        next_after_id = page[-1]._id if len(rows) > limit else None
+
+        return members_page_response(page, 'next_after_id', next_after_id)
+
+    def _stream_ndjson(self, after_id, limit):
+        """Return a streamed response containing a JSON object for every
+        member (having an ID greater than after_id) on its own line, in 
+        ascending order of ID. At most 'limit' members are written if a limit
+        is given.
+        """
+        batch_size = min(limit, MEMBERS_BATCH_SIZE) if limit else MEMBERS_BATCH_SIZE
+        batches = iter_member_batches(after_id, batch_size)
+        first_batch = next(batches, None)
+
+        if first_batch is None and after_id is None:
+            abort(404, error_code=404, error_msg='No member exist in the database')
+
+        to_json = member_row_serializer.to_json
+        if uses_restful_json():
+            # Every member must stay on a single line
+            settings = {key: value for key, value in app.config.get('RESTFUL_JSON', {}).items() if key != 'indent'}
+            to_json = lambda row: json.dumps(dict(zip(record_fields, row)), **settings)
+
+        def generate():
+            remaining = limit
+            for batch in chain([first_batch] if first_batch else [], batches):
+                if remaining is not None:
+                    batch = batch[:remaining]
+                    remaining -= len(batch)
+                yield ''.join(
+                    to_json(row) + '\n' for row in batch
+                )
+                if remaining == 0:
+                    return
+
+        return Response(stream_with_context(generate()), status=200, mimetype='application/x-ndjson')
 
-    @marshal_with(record_fields)
     def post(self):
         """Handles POST requests to the resource.
 
@@ -108,43 +740,76 @@ class MemberEntity(Resource):
         data as an error message.
 
         Aborts the request if a member with the given name or email ID already exists
-        and thus, return a 409 error with a message.
+        and thus, return a 409 error with a message. Duplicates are detected by 
+        the unique indexes on the name and email columns when the member is 
+        inserted, so creating a member takes a single round trip and two concurrent
+        requests can't create the same member.
         """
-        new_member_args = record_parser_for_post_put.parse_args(strict=True)
-
-        name_record = db.session.query(Member).filter_by(name=new_member_args['name']).first()
-        email_record = db.session.query(Member).filter_by(name=new_member_args['email']).first()
-        if name_record or email_record:
-            abort(409, error_code=409, error_msg='Cannot create a new member because a member with the given name/email already exists.')
-        
+        new_member_args = record_parser_for_post_put.parse(strict=True)
 
-        new_member = Member(name=new_member_args['name'], email=new_member_args['email'])
-        db.session.add(new_member)
-        db.session.commit()
+        new_member = Member(
+            name=new_member_args['name'], name_normalized=normalize_name(new_member_args['name']),
+            email=new_member_args['email'], updated_at=current_timestamp()
+        )
+        with abort_on_conflict('Cannot create a new member because a member with the given name/email already exists.'):
+            db.session.add(new_member)
+            db.session.flush()
+            record_member_changes(
+                'upsert', [(new_member._id, new_member.name, new_member.email)], new_member.updated_at
+            )
+        invalidate_member(name=new_member.name)
         
-        return new_member, 201
+        return member_object_serializer.response(new_member, 201)
 
     def delete(self):
         """Handles DELETE requests to the specified resource and returns
-        status code 204 to signal that all the members have been
-        successfully removed from the database.
+        status code 202 to signal that a job deleting all the members has
+        been started in the background.
 
-        No additional content/data (like JSON) will be sent back to the user.
+        The members are deleted in chunks, each in its own transaction. Along 
+        with the status code, return a JSON response containing the ID of the
+        job and the URL where its progress can be followed (also sent in the 
+        Location header). If a bulk delete is already running, in any
+        worker, its job is returned instead of starting another one.
 
         Abort handling the request if no member exists in the database
         and return error code 404 with a message.
         """
-        records_to_delete = db.session.query(Member).all()
-
-        if not records_to_delete:
+        if db.session.query(Member._id).limit(1).scalar() is None:
             abort(404, error_code=404, 
                 error_msg='Cannot delete because no members exist in the database'
             )
         
-        db.session.query(Member).delete()
-        db.session.commit()
+        job = job_runner.start('delete_all_members')
+        status_url = api.url_for(MemberDeleteJob, job_id=job.id)
 
-        return '', 204
+        return {'job_id': job.id, 'status': job.status, 'status_url': status_url}, 202, {'Location': status_url}
+
+
+class MemberDeleteJob(Resource):
+    """Resource class to handle requests made at the URL:
+        1. /members/delete/{job_id}
+
+    Handles the following requests at the following endpoint:
+        1. GET - Get the progress of a bulk delete of the members.
+    """
+
+    def get(self, job_id):
+        """Handles GET requests to the resource and returns code 200
+        along with a JSON response containing the status ('running', 
+        'completed' or 'failed') and the progress of the bulk delete job.
+        A running job which hasn't saved its progress for JOBS_STALE_AFTER
+        seconds is resumed by the worker handling the request.
+
+        Abort handling the request if no job with the given ID is known
+        and return error code 404 with a message.
+        """
+        job = job_runner.get(job_id)
+
+        if not job or job.name != 'delete_all_members':
+            abort(404, error_code=404, error_msg='No bulk delete job with the given ID exists')
+
+        return job.to_dict(), 200
 
 
 class MemberRecord(Resource):
@@ -164,7 +829,6 @@ class MemberRecord(Resource):
         4. DELETE - Delete an existing member.
     """
 
-    @marshal_with(record_fields)
     def get(self, user_name):
         """Handles GET requests to the resource and return HTTP code 200
         on a successful completion of a request.
@@ -172,25 +836,49 @@ class MemberRecord(Resource):
         The given name should be identical to the name of the potential
         member that could exist in the database. This means that "Name"
         and "NaMe" are treated as two different values because their cases
-        are different, even though they have the same value.
+        are different, even though they have the same value, unless the name
+        column uses a case-insensitive collation (see MEMBERS_CASE_INSENSITIVE).
 
         Return a JSON response containing details about the specified user. 
         If multiple members with the same name exists, return with info
-        only about the first matching member that was found.
+        only about the first matching member that was found. Members are
+        served from the member cache when possible.
+
+        The response carries an ETag of the member. If the request contains
+        an If-None-Match header matching it, return 304 with an empty body.
+        In that case only the ID and the modification time of the member are
+        looked up, either in the cache or in the database.
 
         Abort handling GET requests and return 404 if no member with
         the specified name is found along with an error message.
         """
-        record = db.session.query(Member).filter_by(name=user_name).first()
+        if request.if_none_match:
+            version = member_cache.get(member_cache_key(user_name))
+            if not version:
+                version = db.session.query(Member._id, Member.updated_at).filter_by(name=user_name).first()
+                version = version._asdict() if version else None
+
+            if version:
+                etag = member_etag(version['_id'], version['updated_at'])
+                if request.if_none_match.contains_weak(etag):
+                    return Response(status=304, headers={'ETag': quote_etag(etag)})
+
+        def load_member():
+            row = db.session.query(
+                Member._id, Member.name, Member.email, Member.updated_at
+            ).filter_by(name=user_name).first()
+            return row._asdict() if row else None
+
+        record = member_cache.get_or_load(member_cache_key(user_name), load_member)
 
         if not record:
             abort(404, error_code=404, 
                 error_msg='No member with the given name exists in the database.'
             )
 
-        return record, 200
+        etag = member_etag(record['_id'], record['updated_at'])
+        return member_serializer.response(record, 200, {'ETag': quote_etag(etag)})
 
-    @marshal_with(record_fields)
     def put(self, user_id):
         """Handles PUT requests at the specified URL and returns status
         code 200 if an already existing member has been overwritten 
@@ -204,23 +892,30 @@ class MemberRecord(Resource):
         Also, if the required data is not passed in a specified format, return
         a 400 error, along with some information about the problem with the given
         data as an error message.
+
+        Abort handling of the request if another member with the given name or
+        email already exists and return a 409 error with a message.
+
+        The member is written by a single upsert statement without reading
+        it first, and the response is built from the written values.
         """
-        member_args = record_parser_for_post_put.parse_args(strict=True)
+        member_args = record_parser_for_post_put.parse(strict=True)
 
-        record = db.session.query(Member).filter_by(_id=user_id).first()
+        member = {
+            '_id': user_id,
+            'name': member_args['name'],
+            'name_normalized': normalize_name(member_args['name']),
+            'email': member_args['email'],
+            'updated_at': current_timestamp()
+        }
+        with abort_on_conflict('Cannot overwrite the member because another member with the given name/email already exists.'):
+            created = upsert(db.session, Member.__table__, member)
+            record_member_changes('upsert', [(user_id, member['name'], member['email'])], member['updated_at'])
 
-        if record:
-            record.name = member_args['name']
-            record.email = member_args['email']
-            db.session.commit()
-            return record, 200
-        else:
-            new_member = Member(_id=user_id, name=member_args['name'], email=member_args['email'])
-            db.session.add(new_member)
-            db.session.commit()
-            return new_member, 201
+        invalidate_member(user_id, member['name'])
+
+        return member_serializer.response(member, 201 if created else 200)
 
-    @marshal_with(record_fields)
     def patch(self, user_id):
         """Handles PATCH requests for the specified resource and returns
         status code 200 to signal that an existing member's information
@@ -232,8 +927,11 @@ class MemberRecord(Resource):
         Also, if the given data contains any invalid fields, return
         a 400 error, along with some information about the invalid arguments
         in the error message.
+
+        Abort handling of the request if another member with the given name or
+        email already exists and return a 409 error with a message.
         """
-        updated_member_args = record_parser_for_patch.parse_args(strict=True)
+        updated_member_args = record_parser_for_patch.parse(strict=True)
 
         record = db.session.query(Member).filter_by(_id=user_id).first()
         
@@ -242,14 +940,19 @@ class MemberRecord(Resource):
                 error_msg='Member cannot be updated because no member with given ID exists in the database'
             )
         
-        if updated_member_args['name']:
-            record.name = updated_member_args['name']
-        if updated_member_args['email']:
-            record.email = updated_member_args['email']
-        
-        db.session.commit()
+        with abort_on_conflict('Member cannot be updated because another member with the given name/email already exists.'):
+            if updated_member_args['name']:
+                record.name = updated_member_args['name']
+                record.name_normalized = normalize_name(updated_member_args['name'])
+            if updated_member_args['email']:
+                record.email = updated_member_args['email']
+            record.updated_at = current_timestamp()
+            db.session.flush()
+            record_member_changes('upsert', [(user_id, record.name, record.email)], record.updated_at)
+
+        invalidate_member(user_id, record.name)
 
-        return record, 200
+        return member_object_serializer.response(record, 200)
 
     def delete(self, user_id):
         """Handles DELETE requests to the specified resource and returns
@@ -269,19 +972,321 @@ class MemberRecord(Resource):
             )
         
         db.session.delete(record_to_delete)
+        db.session.flush()
+        record_member_changes('delete', [user_id], current_timestamp())
         db.session.commit()
+        invalidate_member(user_id)
 
         return '', 204
 
 
+class MemberSearch(Resource):
+    """Resource class to handle requests made at the URL:
+        1. /members/search?q=<str>[&prefix=true&ci=true&limit=<int>&cursor=<str>]
+
+    Handles the following requests at the following endpoint:
+        1. GET - Search the members by name.
+    """
+
+    def get(self):
+        """Handles GET requests to the resource and returns code 200
+        along with a JSON response containing a page of the members whose
+        name matches q, ordered by normalized name and ID, as
+        {"members": [...], "next_cursor": <str|null>}. An empty list of
+        members is returned if none matches.
+
+        The search can be controlled with the following query parameters:
+            1. prefix - true to match the names starting with q instead of
+                        the names equal to q.
+            2. ci     - true to ignore the case of the names.
+            3. limit  - Maximum number of members in the page (20 by default).
+            4. cursor - The next_cursor of the previous page, to get the
+                        next page. It's null for the last page.
+
+        Every search is served by a range scan of the index on
+        name_normalized, and the pages are found by keyset pagination on the
+        index, so the cost of a request is bounded by the limit irrespective
+        of the size of the table. Case-sensitive searches also compare the
+        names in a binary collation (see BINARY_COLLATIONS), as the bounds
+        of prefixes are computed in code point order and the name column may
+        use a case-insensitive collation (see MEMBERS_CASE_INSENSITIVE).
+
+        Abort handling the request and return 400 with an error message if
+        q is empty or longer than a name, if the limit is outside the allowed
+        range or if the cursor is invalid.
+        """
+        search_args = member_search_parser.parse_args()
+        limit = search_args['limit'] if search_args['limit'] is not None else MEMBERS_SEARCH_DEFAULT_LIMIT
+
+        if not 1 <= len(search_args['q']) <= MEMBER_NAME_MAX_LENGTH:
+            abort(400, error_code=400, 
+                error_msg=f'The search term should be between 1 and {MEMBER_NAME_MAX_LENGTH} characters long'
+            )
+        if not 1 <= limit <= MEMBERS_SEARCH_MAX_LIMIT:
+            abort(400, error_code=400, 
+                error_msg=f'The limit should be between 1 and {MEMBERS_SEARCH_MAX_LIMIT}'
+            )
+
+        key = Member.name_normalized
+        query = db.session.query(Member._id, Member.name, Member.email, key.label('key')).filter(
+            *name_conditions(key, normalize_name(search_args['q']), search_args['prefix'])
+        )
+        if not search_args['ci']:
+            binary_name = Member.name.collate(BINARY_COLLATIONS[db.session.get_bind().dialect.name])
+            query = query.filter(*name_conditions(binary_name, search_args['q'], search_args['prefix']))
+
+        if search_args['cursor']:
+            try:
+                after_key, after_id = decode_search_cursor(search_args['cursor'])
+            except ValueError:
+                abort(400, error_code=400, error_msg='The cursor is invalid')
+            query = query.filter(or_(key > after_key, and_(key == after_key, Member._id > after_id)))
+
+        # One extra row tells whether another page exists
+        rows = query.order_by(key, Member._id).limit(limit + 1).all()
+
+        page = rows[:limit]
+        next_cursor = encode_search_cursor(page[-1].key, page[-1]._id) if len(rows) > limit else None
+
+        return members_page_response(page, 'next_cursor', next_cursor)
+
+
+class MemberChangeFeed(Resource):
+    """Resource class to handle requests made at the URL:
+        1. /members/changes[?since=<int>&limit=<int>]
+
+    Handles the following requests at the following endpoint:
+        1. GET - Get the changes of the members table since a given change.
+    """
+
+    def get(self):
+        """Handles GET requests to the resource and returns code 200
+        along with a JSON response containing a page of the change log of
+        the members table, in the order the changes were committed, as
+        {"changes": [...], "next_since": <int>, "has_more": <bool>}.
+
+        Every change has a sequence number (seq), an operation, the _id of
+        the member and the time it was changed at. An 'upsert' (the member
+        was created or modified) carries the new name and email of the
+        member, a 'delete' has a null name and email.
+
+        The page can be controlled with the following query parameters:
+            1. since - Return the changes after the change with this sequence
+                       number (0 by default, i.e. from the start of the log,
+                       which begins with every member existing when the log
+                       was created).
+            2. limit - Maximum number of changes in the page.
+
+        Sequence numbers only ever increase, and a change is never committed
+        after a change with a greater sequence number, so a service syncing
+        the table stores next_since and passes it as 'since' on its next
+        request to only get the changes it hasn't seen. next_since is
+        'since' itself if there is no change after it yet.
+
+        Abort handling the request and return 400 with an error message if
+        since is negative or if the limit is outside the allowed range.
+        """
+        changes_args = member_changes_parser.parse_args()
+        since = changes_args['since']
+        limit = changes_args['limit'] if changes_args['limit'] is not None else MEMBERS_DEFAULT_PAGE_SIZE
+
+        if since < 0:
+            abort(400, error_code=400, error_msg='since should be a sequence number, 0 or greater')
+        if not 1 <= limit <= MEMBERS_MAX_PAGE_SIZE:
+            abort(400, error_code=400, 
+                error_msg=f'The limit should be between 1 and {MEMBERS_MAX_PAGE_SIZE}'
+            )
+
+        rows = db.session.query(
+            MemberChange.seq, MemberChange.operation, MemberChange.member_id,
+            MemberChange.name, MemberChange.email, MemberChange.changed_at
+        ).filter(MemberChange.seq > since).order_by(MemberChange.seq).limit(limit + 1).all()
+
+        page = rows[:limit]
+        next_since = page[-1].seq if page else since
+        return member_changes_response(page, next_since, len(rows) > limit)
+
+
+class CacheStats(Resource):
+    """Resource class to handle requests made at the URL: /internal/cache
+
+    Handles the following requests at the following endpoint:
+        1. GET - Get the size and the counters of the member cache.
+    """
+
+    def get(self):
+        """Handles GET requests to the resource and returns code 200
+        along with a JSON response containing the configuration, the current
+        size and the hit, miss, eviction, expiration and invalidation counters
+        of the member cache, along with the counters of the coalesced loads of
+        members (see singleflight.py) and of the invalidation channel.
+        """
+        return {
+            'members': member_cache.stats(),
+            'loads': member_loads.stats(),
+            'channel': invalidation_channel.stats()
+        }, 200
+
+
+class AdmissionStats(Resource):
+    """Resource class to handle requests made at the URL: /internal/admission
+
+    Handles the following requests at the following endpoint:
+        1. GET - Get the state of the admission control of the members endpoints.
+    """
+
+    def get(self):
+        """Handles GET requests to the resource and returns code 200
+        along with a JSON response containing the limits of the admission
+        control, along with the number of requests in flight (now and at the
+        peak) and queued across the endpoints it applies to, the average time
+        (in seconds) taken by a request and the number of rejected requests,
+        by reason, of every endpoint.
+        """
+        return admission_controller.stats(), 200
+
+
+class PoolStats(Resource):
+    """Resource class to handle requests made at the URL: /internal/pool
+
+    Handles the following requests at the following endpoint:
+        1. GET - Get the state of the database connection pool.
+    """
+
+    def get(self):
+        """Handles GET requests to the resource and returns code 200
+        along with a JSON response containing the number of checked out,
+        idle and overflow connections of the pool, along with the number of
+        checkouts, the number of checkouts which timed out and the total,
+        average and maximum time (in seconds) callers waited for a connection.
+        """
+        return db.engine.pool.stats(), 200
+
+
 # Adding member table related resource to the API and specifying their endpoints
 api.add_resource(MemberEntity, '/members/all', endpoint='get_all_members')
 api.add_resource(MemberEntity, '/members/new', endpoint='create_new_member')
 api.add_resource(MemberEntity, '/members/delete', endpoint='delete_all_members')
+api.add_resource(MemberDeleteJob, '/members/delete/<string:job_id>', endpoint='get_delete_job')
+api.add_resource(MemberSearch, '/members/search', endpoint='search_members')
+api.add_resource(MemberChangeFeed, '/members/changes', endpoint='get_member_changes')
 api.add_resource(MemberRecord, '/members/<string:user_name>', endpoint='get_member_by_name')
 api.add_resource(MemberRecord, '/members/<int:user_id>/replace', endpoint='overwrite_existing_member')
 api.add_resource(MemberRecord, '/members/<int:user_id>/update', endpoint='update_existing_member')
 api.add_resource(MemberRecord, '/members/<int:user_id>/delete', endpoint='delete_existing_member')
+api.add_resource(CacheStats, '/internal/cache', endpoint='cache_stats')
+api.add_resource(PoolStats, '/internal/pool', endpoint='pool_stats')
+api.add_resource(AdmissionStats, '/internal/admission', endpoint='admission_stats')
+
+# Requests to the endpoints querying the members tables share the slots of a
+# single limiter sized to the connection pool (see admission.py), so that they
+# are shed instead of piling up when the database slows down. The queue and
+# the rejections are exposed at /metrics.
+admission_controller = AdmissionController(
+    app,
+    endpoints=(
+        'get_all_members', 'create_new_member', 'delete_all_members', 'get_delete_job', 'search_members',
+        'get_member_changes', 'get_member_by_name', 'overwrite_existing_member', 'update_existing_member',
+        'delete_existing_member'
+    ),
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    max_per_client=ADMISSION_MAX_PER_CLIENT,
+    client_header=ADMISSION_CLIENT_HEADER
+)
+request_metrics.add_collector(admission_controller.collect)
+
+
+@app.cli.command('save-schema-snapshot')
+def save_schema_snapshot():
+    """Reflect the schema of the database and save it as a snapshot 
+    at SCHEMA_SNAPSHOT_PATH to be loaded by the app on start up.
+    """
+    if not SCHEMA_SNAPSHOT_PATH:
+        raise click.UsageError('SCHEMA_SNAPSHOT_PATH is not set')
+
+    schema_snapshot.save_snapshot(schema_snapshot.reflect_metadata(db.engine), SCHEMA_SNAPSHOT_PATH)
+    click.echo(f'Saved the schema snapshot to {SCHEMA_SNAPSHOT_PATH}')
+
+
+# Fields of the members in the files of `flask members import/export`, along
+# with their type and whether an imported member must have them. Members
+# imported without an _id are given one by the database.
+MEMBER_BULK_FIELDS = {'_id': (int, False), 'name': (str, True), 'email': (str, True)}
+
+members_cli = AppGroup('members', help='Import and export the members table.')
+app.cli.add_command(members_cli)
+
+
+@members_cli.command('import')
+@click.argument('source', type=click.File('r', encoding='utf-8'), default='-')
+@click.option('--format', 'format_', type=click.Choice(FORMATS), help='Format of the file, guessed from its extension by default')
+@click.option('--batch-size', type=click.IntRange(min=1), default=MEMBERS_IMPORT_BATCH_SIZE, show_default=True, 
+    help='Number of members inserted by every transaction'
+)
+def import_members(source, format_, batch_size):
+    """Insert the members of a CSV or NDJSON file (or of stdin) into the 
+    database, instead of POSTing them one at a time.
+
+    Every member has a name, an email and optionally an _id. The file is 
+    read as it's inserted, with a multi-row INSERT per batch of members, so 
+    files of any size are imported in constant memory. Batches are committed 
+    as they're inserted, along with their changes in the change log: if a 
+    name, email or ID is already in use, the import stops and the batches 
+    before the failing one stay imported.
+    """
+    progress = Progress('Imported', 'members')
+    for batch in batched(read_records(source, detect_format(source, format_), MEMBER_BULK_FIELDS), batch_size):
+        updated_at = current_timestamp()
+        for record in batch:
+            record.setdefault('_id', None)
+            record['name_normalized'] = normalize_name(record['name'])
+            record['updated_at'] = updated_at
+
+        try:
+            db.session.execute(Member.__table__.insert(), batch)
+            # The IDs given by the database are only known by reading the
+            # members back, by their unique names
+            inserted = db.session.query(Member._id, Member.name, Member.email).filter(
+                Member.name.in_([record['name'] for record in batch])
+            ).order_by(Member._id).all()
+            record_member_changes('upsert', inserted, updated_at)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            progress.done()
+            raise click.ClickException(
+                f'A name, email or ID of the members {progress.rows + 1} to {progress.rows + len(batch)} is already in use'
+            )
+        progress.add(len(batch))
+    progress.done()
+
+
+@members_cli.command('export')
+@click.argument('destination', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'format_', type=click.Choice(FORMATS), help='Format of the file, guessed from its extension by default')
+@click.option('--batch-size', type=click.IntRange(min=1), default=MEMBERS_BATCH_SIZE, show_default=True, 
+    help='Number of members fetched by every query'
+)
+def export_members(destination, format_, batch_size):
+    """Write every member, in order of ID, to a CSV or NDJSON file (or to stdout).
+
+    The table is read in batches with keyset pagination (see 
+    iter_member_batches) rather than through a server-side cursor, which 
+    mysqlconnector doesn't support, so tables of any size are exported in 
+    constant memory.
+    """
+    progress = Progress('Exported', 'members')
+
+    def rows():
+        for batch in iter_member_batches(batch_size=batch_size):
+            yield from batch
+            progress.add(len(batch))
+
+    write_records(destination, detect_format(destination, format_), list(MEMBER_BULK_FIELDS), rows())
+    progress.done()
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,434 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+
+from prefork import METRICS_DIR_ENV
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the buckets of the histogram of SQL statements per request
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Maximum number of statements of a single request kept for the slow request log
+MAX_LOGGED_STATEMENTS = 50
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds between two snapshots of the metrics of a worker process of
+# prefork.py written for the other workers to expose (see RequestMetrics)
+SNAPSHOT_INTERVAL = 1.0
+
+
+class Histogram:
+    """A Prometheus histogram with a series per combination of label values."""
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_values, value):
+        """Record a value in the series of the given label values. Must be
+        called with the lock of the owner of the histogram held.
+        """
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        position = bisect_left(self.buckets, value)
+        if position < len(self.buckets):
+            series[0][position] += 1
+        series[1] += value
+        series[2] += 1
+
+    def snapshot(self):
+        """Return a copy of the histogram which can be serialized into JSON.
+        Must be called with the lock of the owner of the histogram held.
+        """
+        return {
+            'type': 'histogram', 'name': self.name, 'documentation': self.documentation,
+            'label_names': self.label_names, 'buckets': self.buckets,
+            'series': [[label_values, [list(counts), total, count]] for label_values, (counts, total, count) in self._series.items()]
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Return an empty histogram with the name, labels and buckets of a snapshot."""
+        return cls(snapshot['name'], snapshot['documentation'], tuple(snapshot['label_names']), tuple(snapshot['buckets']))
+
+    def add_snapshot(self, snapshot):
+        """Add the series of a snapshot of the same histogram to this one."""
+        for label_values, (counts, total, count) in snapshot['series']:
+            series = self._series.setdefault(tuple(label_values), [[0] * len(self.buckets), 0.0, 0])
+            series[0] = [mine + theirs for mine, theirs in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+    def expose(self):
+        """Return the lines of the histogram in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            labels = format_labels(self.label_names, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    """A Prometheus counter with a series per combination of label values."""
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._series = {}
+
+    def inc(self, label_values, amount=1):
+        """Increment the series of the given label values. Must be called
+        with the lock of the owner of the counter held.
+        """
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def get(self, label_values):
+        """Return the value of the series of the given label values. Must
+        be called with the lock of the owner of the counter held.
+        """
+        return self._series.get(label_values, 0)
+
+    def snapshot(self):
+        """Return a copy of the counter which can be serialized into JSON.
+        Must be called with the lock of the owner of the counter held.
+        """
+        return {
+            'type': 'counter', 'name': self.name, 'documentation': self.documentation,
+            'label_names': self.label_names, 'series': list(self._series.items())
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Return an empty counter with the name and labels of a snapshot."""
+        return cls(snapshot['name'], snapshot['documentation'], tuple(snapshot['label_names']))
+
+    def add_snapshot(self, snapshot):
+        """Add the series of a snapshot of the same counter to this one."""
+        for label_values, value in snapshot['series']:
+            self.inc(tuple(label_values), value)
+
+    def expose(self):
+        """Return the lines of the counter in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{{{format_labels(self.label_names, label_values)}}} {value}')
+        return lines
+
+
+class Gauge:
+    """A Prometheus gauge with a series per combination of label values."""
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._series = {}
+
+    def set(self, label_values, value):
+        """Set the series of the given label values. Must be called with
+        the lock of the owner of the gauge held.
+        """
+        self._series[label_values] = value
+
+    def snapshot(self):
+        """Return a copy of the gauge which can be serialized into JSON.
+        Must be called with the lock of the owner of the gauge held.
+        """
+        return {
+            'type': 'gauge', 'name': self.name, 'documentation': self.documentation,
+            'label_names': self.label_names, 'series': list(self._series.items())
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Return an empty gauge with the name and labels of a snapshot."""
+        return cls(snapshot['name'], snapshot['documentation'], tuple(snapshot['label_names']))
+
+    def add_snapshot(self, snapshot):
+        """Add the series of a snapshot of the same gauge to this one."""
+        for label_values, value in snapshot['series']:
+            label_values = tuple(label_values)
+            self._series[label_values] = self._series.get(label_values, 0) + value
+
+    def expose(self):
+        """Return the lines of the gauge in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        for label_values, value in sorted(self._series.items()):
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}{{{labels}}} {value}' if labels else f'{self.name} {value}')
+        return lines
+
+
+METRIC_TYPES = {'histogram': Histogram, 'counter': Counter, 'gauge': Gauge}
+
+
+def merge_snapshots(snapshots):
+    """Return the metrics adding up the series of the given snapshots of
+    metrics, in the order the metrics first appear in them.
+    """
+    metrics = {}
+    for snapshot in snapshots:
+        metric = metrics.get(snapshot['name'])
+        if metric is None:
+            metric = metrics[snapshot['name']] = METRIC_TYPES[snapshot['type']].from_snapshot(snapshot)
+        metric.add_snapshot(snapshot)
+    return list(metrics.values())
+
+
+def format_labels(label_names, label_values):
+    """Format label pairs, escaping the values as the text format requires."""
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(label_names, label_values)
+    )
+
+
+class RequestState:
+    """Timings and SQL statements of the request being handled."""
+
+    __slots__ = ('started', 'status', 'statement_count', 'statement_time', 'statements', 'statement_started')
+
+    def __init__(self, keep_statements):
+        self.started = time.perf_counter()
+        self.status = 500
+        self.statement_count = 0
+        self.statement_time = 0.0
+        self.statements = [] if keep_statements else None
+        self.statement_started = None
+
+
+class RequestMetrics:
+    """Records the latency of every request handled by a Flask app, per
+    endpoint name and method, and exposes it at /metrics in the Prometheus
+    text format.
+
+    With instrument_sql set, the SQL statements run by a request are counted
+    and timed through the engine events of SQLAlchemy, which are listened to
+    on every engine of the process. Statements run outside of a request
+    (e.g. by background threads) aren't recorded.
+
+    If slow_request_threshold is set, every request taking longer than that
+    many seconds is logged as a warning along with its statements.
+
+    Requests are recorded when their context is torn down, so the time spent
+    streaming a response is included.
+
+    Under prefork.py, every worker process writes a snapshot of its metrics
+    to the directory named by METRICS_DIR_ENV, after its requests at most
+    every SNAPSHOT_INTERVAL seconds and when it exits. /metrics adds up the
+    snapshots of all the workers, so whichever worker serves it, it exposes
+    the metrics of the whole server (the ones of the other workers up to
+    SNAPSHOT_INTERVAL seconds old). The counters and histograms of the
+    workers which have exited are kept, so that they never go backwards,
+    while their gauges are left out.
+    """
+
+    def __init__(self, app=None, instrument_sql=True, slow_request_threshold=None):
+        self.instrument_sql = instrument_sql
+        self.slow_request_threshold = slow_request_threshold
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time taken to handle a request.',
+            ('endpoint', 'method'), LATENCY_BUCKETS
+        )
+        self.requests = Counter('http_requests_total', 'Number of handled requests.', ('endpoint', 'method', 'status'))
+        self.sql_statements = Histogram(
+            'http_request_sql_statements', 'Number of SQL statements run by a request.',
+            ('endpoint', 'method'), STATEMENT_BUCKETS
+        )
+        self.sql_duration = Histogram(
+            'http_request_sql_duration_seconds', 'Total time taken by the SQL statements of a request.',
+            ('endpoint', 'method'), LATENCY_BUCKETS
+        )
+        self._collectors = []
+        # Whether requests have been recorded since the last snapshot, and
+        # the process whose snapshots are being written
+        self._changed = False
+        self._writer_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the hooks recording the requests of the app along with
+        the /metrics endpoint.
+        """
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.expose)
+
+        if self.instrument_sql:
+            from sqlalchemy import event
+            from sqlalchemy.engine import Engine
+
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def add_collector(self, collect):
+        """Expose the metrics returned by collect() (the snapshots of
+        metrics recorded outside of this object) at /metrics as well.
+        """
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        """Return the snapshots of all the metrics of this process."""
+        with self._lock:
+            metrics = [self.request_duration, self.requests]
+            if self.instrument_sql:
+                metrics += [self.sql_statements, self.sql_duration]
+            snapshots = [metric.snapshot() for metric in metrics]
+        for collect in self._collectors:
+            snapshots.extend(collect())
+        return snapshots
+
+    def expose(self):
+        """Return a response containing all the metrics in the Prometheus text format."""
+        snapshots = self.snapshot()
+        directory = os.environ.get(METRICS_DIR_ENV)
+        if directory:
+            self._write_snapshot(directory, snapshots)
+            snapshots = self._read_snapshots(directory)
+        lines = [line for metric in merge_snapshots(snapshots) for line in metric.expose()]
+        return Response('\n'.join(lines) + '\n', content_type=CONTENT_TYPE)
+
+    def _before_request(self):
+        g.request_metrics = RequestState(self.slow_request_threshold is not None)
+
+    def _after_request(self, response):
+        state = g.get('request_metrics')
+        if state is not None:
+            state.status = response.status_code
+        return response
+
+    def _teardown_request(self, error=None):
+        state = g.pop('request_metrics', None)
+        if state is None:
+            return
+        duration = time.perf_counter() - state.started
+        endpoint = request.url_rule.endpoint if request.url_rule else 'none'
+        labels = (endpoint, request.method)
+
+        with self._lock:
+            self.request_duration.observe(labels, duration)
+            self.requests.inc(labels + (str(state.status),))
+            if self.instrument_sql:
+                self.sql_statements.observe(labels, state.statement_count)
+                self.sql_duration.observe(labels, state.statement_time)
+            self._changed = True
+
+        if self._writer_pid != os.getpid() and os.environ.get(METRICS_DIR_ENV):
+            self._start_snapshot_writer(os.environ[METRICS_DIR_ENV])
+
+        if self.slow_request_threshold is not None and duration >= self.slow_request_threshold:
+            self._log_slow_request(state, endpoint, duration)
+
+    def _log_slow_request(self, state, endpoint, duration):
+        """Log a request which took longer than the slow request threshold."""
+        statements = ''.join(
+            f'\n    [{statement_duration * 1000:.2f} ms] {statement}' for statement, statement_duration in state.statements
+        )
+        if state.statement_count > len(state.statements):
+            statements += f'\n    ... {state.statement_count - len(state.statements)} more statements'
+        logger.warning(
+            'Slow request: %s %s (%s) returned %s in %.2f ms, running %d SQL statements in %.2f ms%s',
+            request.method, request.full_path.rstrip('?'), endpoint, state.status, duration * 1000,
+            state.statement_count, state.statement_time * 1000, statements
+        )
+
+    def _start_snapshot_writer(self, directory):
+        """Start writing the snapshots of this worker process, unless it
+        has already started.
+        """
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+
+        def write_changes():
+            while True:
+                time.sleep(SNAPSHOT_INTERVAL)
+                with self._lock:
+                    changed, self._changed = self._changed, False
+                if changed:
+                    self._write_snapshot(directory, self.snapshot())
+
+        threading.Thread(target=write_changes, name='metrics-snapshots', daemon=True).start()
+        atexit.register(lambda: self._write_snapshot(directory, self.snapshot()))
+
+    def _write_snapshot(self, directory, snapshots):
+        """Replace the snapshot file of this process."""
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        try:
+            with open(f'{path}.tmp', 'w') as snapshot_file:
+                json.dump(snapshots, snapshot_file)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            logger.exception('Cannot write the snapshot of the metrics to %s', path)
+
+    def _read_snapshots(self, directory):
+        """Return the snapshots of the metrics of every worker process,
+        leaving out the gauges of the ones which have exited.
+        """
+        snapshots = []
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, file_name)) as snapshot_file:
+                    worker_snapshots = json.load(snapshot_file)
+            except (OSError, ValueError):
+                continue
+            if not _is_running(int(file_name[:-len('.json')])):
+                worker_snapshots = [snapshot for snapshot in worker_snapshots if snapshot['type'] != 'gauge']
+            snapshots.extend(worker_snapshots)
+        return snapshots
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            state = g.get('request_metrics')
+            if state is not None:
+                state.statement_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        state = g.get('request_metrics')
+        if state is None or state.statement_started is None:
+            return
+        elapsed = time.perf_counter() - state.statement_started
+        state.statement_started = None
+        state.statement_count += 1
+        state.statement_time += elapsed
+        if state.statements is not None and len(state.statements) < MAX_LOGGED_STATEMENTS:
+            state.statements.append((' '.join(statement.split()), elapsed))
+
+
+def _is_running(pid):
+    """Return True if a process with the given PID is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,6 @@
+-- Adds the last modification time of a member, stored as the number of
+-- microseconds since the epoch, which is used to build the ETags of the
+-- members. The index lets the ETag of the whole table be computed
+-- without reading the rows.
+ALTER TABLE members ADD COLUMN updated_at BIGINT NOT NULL DEFAULT 0;
+CREATE INDEX ix_members_updated_at ON members (updated_at);
@@ -0,0 +1,20 @@
+-- Enforces the uniqueness of the names and emails of members. A new member
+-- is created with a single INSERT and a duplicate is reported by the database
+-- as a violation of these constraints, which also holds for concurrent requests.
+-- The index on name serves the lookups of members by name.
+--
+-- Existing duplicates have to be removed before running this migration.
+--
+-- Names and emails are compared using the collation of their columns. By
+-- default, the case-insensitive collation of the table is used, so "Joe" and
+-- "joe" are the same member, which is what the app assumes unless
+-- MEMBERS_CASE_INSENSITIVE is set to false.
+-- For case-sensitive names and emails, switch the columns to a binary collation
+-- first (keeping their current length) and set MEMBERS_CASE_INSENSITIVE=false
+-- for the app, e.g.:
+--     ALTER TABLE members
+--         MODIFY name VARCHAR(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+--         MODIFY email VARCHAR(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL;
+ALTER TABLE members
+    ADD UNIQUE INDEX ux_members_name (name),
+    ADD UNIQUE INDEX ux_members_email (email);
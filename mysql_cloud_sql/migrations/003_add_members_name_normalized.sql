@@ -0,0 +1,10 @@
+-- Adds the normalized (lower case) name of a member, which the app writes
+-- along with the name, and an index on it serving the case-insensitive and
+-- prefix searches of /members/search. The binary collation makes the index
+-- order the code point order the app computes the bounds of prefixes in.
+-- InnoDB appends the primary key to the index, which the searches are
+-- paginated by after the name.
+ALTER TABLE members
+    ADD COLUMN name_normalized VARCHAR(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL DEFAULT '';
+UPDATE members SET name_normalized = LOWER(name);
+CREATE INDEX ix_members_name_normalized ON members (name_normalized);
@@ -0,0 +1,36 @@
+-- Adds the change log of the members table. Every request writing members
+-- (and every chunk of a bulk delete) appends its changes to it in the same
+-- transaction, and /members/changes serves it to the services keeping a copy
+-- of the table in sync, which only fetch the changes after the last one they saw.
+--
+-- The sequence numbers of the changes are taken from the single row of
+-- member_change_sequence, which every writing transaction increments right
+-- before committing. The lock on that row is held until the commit, so the
+-- changes are committed in the order of their sequence numbers: once a reader
+-- has seen a change it has seen every change before it, and a change committed
+-- late can't be skipped, as it could be with an AUTO_INCREMENT column.
+--
+-- The log starts with a change for every existing member, so that a new
+-- service can sync the whole table from ?since=0. Run it while no members are
+-- being written, then save the schema snapshot again if SCHEMA_SNAPSHOT_PATH
+-- is set (flask save-schema-snapshot).
+CREATE TABLE member_change_sequence (
+    id TINYINT NOT NULL PRIMARY KEY,
+    last_seq BIGINT NOT NULL
+);
+
+CREATE TABLE member_changes (
+    seq BIGINT NOT NULL PRIMARY KEY,
+    member_id INT NOT NULL,
+    -- Either 'upsert' (the member was created or modified, and name and
+    -- email are its new values) or 'delete' (name and email are NULL)
+    operation VARCHAR(6) NOT NULL,
+    name VARCHAR(100) CHARACTER SET utf8mb4 NULL,
+    email VARCHAR(100) CHARACTER SET utf8mb4 NULL,
+    changed_at BIGINT NOT NULL
+);
+
+INSERT INTO member_changes (seq, member_id, operation, name, email, changed_at)
+    SELECT ROW_NUMBER() OVER (ORDER BY _id), _id, 'upsert', name, email, updated_at FROM members;
+INSERT INTO member_change_sequence (id, last_seq)
+    SELECT 1, COUNT(*) FROM member_changes;
@@ -0,0 +1,25 @@
+-- Adds the table the bulk deletes of members are tracked in (see jobs.py),
+-- so that every worker process and instance serving the app can report the
+-- status of a job started by another one, and a job whose process stopped
+-- can be resumed from its saved progress.
+--
+-- running_name is the name of a running job and NULL once it has finished,
+-- so that the unique index allows a single running job of every name.
+-- owner identifies the run of the job currently allowed to save its
+-- progress, which changes whenever another process takes the job over.
+-- The times are in seconds since the epoch. Save the schema snapshot again
+-- if SCHEMA_SNAPSHOT_PATH is set (flask save-schema-snapshot).
+CREATE TABLE jobs (
+    id CHAR(32) NOT NULL PRIMARY KEY,
+    name VARCHAR(64) NOT NULL,
+    running_name VARCHAR(64) NULL,
+    status VARCHAR(9) NOT NULL,
+    progress TEXT NOT NULL,
+    error TEXT NULL,
+    owner CHAR(32) NOT NULL,
+    started_at DOUBLE NOT NULL,
+    heartbeat_at DOUBLE NOT NULL,
+    finished_at DOUBLE NULL
+);
+CREATE UNIQUE INDEX ux_jobs_running_name ON jobs (running_name);
+CREATE INDEX ix_jobs_finished_at ON jobs (finished_at);
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool which keeps track of how long callers had to wait to
+    check out a connection and how many of them gave up after pool_timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return connection
+
+    def stats(self):
+        """Return a dict containing the state of the connections in the
+        pool and the time spent by callers waiting for a checkout.
+        """
+        with self._stats_lock:
+            return {
+                'size': self.size(),
+                'checked_out': self.checkedout(),
+                'idle': self.checkedin(),
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'timeout': self._timeout,
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'total_checkout_wait': self.total_wait,
+                'average_checkout_wait': self.total_wait / self.checkouts if self.checkouts else 0.0,
+                'max_checkout_wait': self.max_wait
+            }
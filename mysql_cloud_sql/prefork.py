@@ -0,0 +1,227 @@
+"""Pre-forking multi-process server for the Flask app of main.py.
+
+The master process imports the app and binds the listening socket once,
+then forks the worker processes, which all accept connections from that
+socket and serve them with a thread per request, like app.run does. Workers
+share the memory of the imported app until they write to it, and a worker
+which dies is replaced.
+
+The master also relays the messages of the invalidation channel: every
+worker is connected to the master by a Unix socket pair, and every message a
+worker sends (e.g. the IDs of the rows it has just written) is forwarded to
+all the other workers, so that they can drop their cached copies (see
+invalidation.py). A worker which can't keep up with the messages is sent a
+reset message instead of the ones it missed.
+
+The workers write snapshots of their metrics to a temporary directory
+created by the master, named by the METRICS_DIR_ENV environment variable,
+so that /metrics exposes the metrics of all the workers (see metrics.py).
+
+Usage (on Unix only):
+    python prefork.py [--host HOST] [--port PORT] [--workers N] [--no-threads]
+
+The number of workers defaults to WEB_CONCURRENCY if set, or else the
+number of CPUs available to the process.
+"""
+import argparse
+import logging
+import os
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+# Environment variable telling a worker the file descriptor of its end of
+# the invalidation channel. It's only set while the worker is being forked.
+CHANNEL_FD_ENV = 'PREFORK_CHANNEL_FD'
+# Maximum size of a message of the invalidation channel
+MAX_MESSAGE_SIZE = 2 ** 17
+# Message sent to a worker which missed messages, telling it to reset
+# everything kept consistent through the channel.
+RESET_MESSAGE = b'["*reset", null]'
+# Environment variable telling the workers the directory where they write
+# the snapshots of their metrics
+METRICS_DIR_ENV = 'PREFORK_METRICS_DIR'
+# Seconds the master waits for messages before checking on the workers
+POLL_INTERVAL = 0.5
+
+
+def default_workers():
+    """Return the number of workers to run by default."""
+    if os.getenv('WEB_CONCURRENCY'):
+        return int(os.getenv('WEB_CONCURRENCY'))
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class PreforkServer:
+    """Serves a WSGI app with 'workers' processes forked from this one,
+    relaying the messages of the invalidation channel between them.
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=None, threaded=True):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or default_workers()
+        self.threaded = threaded
+        self.server = None
+        # The master's end of the channel of every worker, by PID
+        self._channels = {}
+        # PIDs of the workers which missed messages and have to be reset
+        self._needs_reset = set()
+        self._master_pid = os.getpid()
+        self._stopping = False
+
+    def serve_forever(self):
+        """Bind the socket, start the workers and supervise them until the
+        master receives SIGINT or SIGTERM.
+        """
+        self.server = make_server(self.host, self.port, self.app, threaded=self.threaded)
+        # Every worker waits for connections on the socket, and the ones
+        # which lose the race for a connection mustn't block in accept().
+        self.server.socket.setblocking(False)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        metrics_dir = os.environ[METRICS_DIR_ENV] = tempfile.mkdtemp(prefix='prefork-metrics-')
+
+        logger.info('Serving on http://%s:%d with %d workers', self.host, self.server.server_port, self.workers)
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while not self._stopping:
+                self._relay()
+                self._reap()
+        finally:
+            # A worker exiting unwinds this frame as well
+            if os.getpid() == self._master_pid:
+                self._stop_workers()
+                shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    def _spawn(self):
+        """Fork a new worker, connected to the master by a new channel."""
+        master_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        os.environ[CHANNEL_FD_ENV] = str(worker_end.fileno())
+        try:
+            pid = os.fork()
+        finally:
+            if os.getpid() == self._master_pid:
+                del os.environ[CHANNEL_FD_ENV]
+
+        if pid == 0:
+            # The worker's end is owned by its invalidation channel, if any
+            worker_end.detach()
+            master_end.close()
+            for channel in self._channels.values():
+                channel.close()
+            self._run_worker()
+            sys.exit(0)
+
+        worker_end.close()
+        self._channels[pid] = master_end
+
+    def _run_worker(self):
+        """Serve requests in a newly forked worker until it's terminated."""
+        self._channels = {}
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # Exiting through SystemExit runs the atexit hooks (e.g. flushing
+        # buffered counters) of the app.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.server.serve_forever()
+
+    def _relay(self):
+        """Forward the messages sent by every worker to the other workers."""
+        for pid in list(self._needs_reset):
+            if self._send(pid, RESET_MESSAGE):
+                self._needs_reset.discard(pid)
+
+        by_socket = {channel: pid for pid, channel in self._channels.items()}
+        try:
+            readable, _, _ = select.select(list(by_socket), [], [], POLL_INTERVAL)
+        except InterruptedError:
+            return
+
+        for channel in readable:
+            try:
+                message = channel.recv(MAX_MESSAGE_SIZE)
+            except OSError:
+                continue
+            for pid in self._channels:
+                if pid != by_socket[channel] and pid not in self._needs_reset and not self._send(pid, message):
+                    self._needs_reset.add(pid)
+
+    def _send(self, pid, message):
+        """Send a message to a worker without blocking and return whether
+        it has been sent.
+        """
+        try:
+            self._channels[pid].send(message, socket.MSG_DONTWAIT)
+            return True
+        except BlockingIOError:
+            return False
+        except OSError:
+            # The worker has died, it's replaced by _reap()
+            return True
+
+    def _reap(self):
+        """Replace the workers which have exited."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            channel = self._channels.pop(pid, None)
+            if channel is None:
+                continue
+            channel.close()
+            self._needs_reset.discard(pid)
+            if not self._stopping:
+                logger.warning('Worker %d exited with status %d, starting a new one', pid, status)
+                self._spawn()
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _stop_workers(self):
+        """Terminate the workers and wait until they have exited."""
+        for pid in self._channels:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid, channel in self._channels.items():
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            channel.close()
+        self._channels = {}
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--no-threads', action='store_true', help='Handle a single request at a time per worker')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(process)d] %(message)s')
+    from main import app
+
+    PreforkServer(app, args.host, args.port, args.workers, threaded=not args.no_threads).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+import sqlalchemy
+from sqlalchemy import MetaData
+
+logger = logging.getLogger(__name__)
+
+
+def reflect_metadata(engine, only=None):
+    """Reflect the schema of the database (or only the given tables)
+    into a new MetaData object.
+    """
+    metadata = MetaData()
+    metadata.reflect(engine, only=only)
+    return metadata
+
+
+def fingerprint(metadata):
+    """Return a hash of the tables, columns, keys and indexes described by
+    the given MetaData which changes whenever the schema changes.
+    """
+    parts = []
+    for table in sorted(metadata.tables.values(), key=lambda table: table.name):
+        parts.append(f'table {table.name}')
+        for column in table.columns:
+            parts.append(f'column {column.name} {column.type!r} {column.nullable} {column.primary_key}')
+        for index in sorted(table.indexes, key=lambda index: index.name or ''):
+            parts.append(f'index {index.name} {index.unique} {[column.name for column in index.columns]}')
+        for key in sorted(table.foreign_keys, key=lambda key: key.target_fullname):
+            parts.append(f'foreign_key {key.parent.name} {key.target_fullname}')
+
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def save_snapshot(metadata, path):
+    """Serialize the given MetaData along with its fingerprint to a file.
+
+    The file is written to a temporary path first and moved into place,
+    so that a process starting concurrently never reads a partial snapshot.
+    """
+    snapshot = {
+        'sqlalchemy_version': sqlalchemy.__version__,
+        'fingerprint': fingerprint(metadata),
+        'metadata': metadata
+    }
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as snapshot_file:
+        pickle.dump(snapshot, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def read_snapshot(path):
+    """Return the snapshot stored in the given file, or None if it doesn't
+    exist or was created by a different version of SQLAlchemy.
+    """
+    try:
+        with open(path, 'rb') as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+
+    if snapshot.get('sqlalchemy_version') != sqlalchemy.__version__:
+        logger.warning('Ignoring schema snapshot %s created by SQLAlchemy %s',
+            path, snapshot.get('sqlalchemy_version')
+        )
+        return None
+
+    return snapshot
+
+
+class SnapshotCheck:
+    """Compares the fingerprint of a schema snapshot against the fingerprint
+    of the live schema of the database on a background thread.
+
+    The result is logged and kept in 'status', which is one of 'pending',
+    'fresh', 'stale' or 'failed'.
+    """
+
+    def __init__(self, engine, snapshot, path):
+        self.engine = engine
+        self.snapshot = snapshot
+        self.path = path
+        self.status = 'pending'
+        self.live_fingerprint = None
+
+    def start(self, delay=0):
+        """Run the check on a daemon thread after waiting for 'delay' seconds."""
+        timer = threading.Timer(delay, self.run)
+        timer.daemon = True
+        timer.start()
+
+    def run(self):
+        """Reflect the tables of the snapshot from the database and compare
+        the fingerprints of both the schemas.
+        """
+        try:
+            tables = list(self.snapshot['metadata'].tables)
+            self.live_fingerprint = fingerprint(reflect_metadata(self.engine, only=tables))
+        except Exception:
+            self.status = 'failed'
+            logger.exception('Failed to check the schema snapshot %s against the database', self.path)
+            return
+
+        if self.live_fingerprint == self.snapshot['fingerprint']:
+            self.status = 'fresh'
+        else:
+            self.status = 'stale'
+            logger.warning('The schema snapshot %s doesn\'t match the schema of the database. '
+                'Regenerate it with "flask save-schema-snapshot" and restart the app.', self.path
+            )
+
+
+def load_metadata(engine, path=None, check_delay=0):
+    """Return the MetaData describing the schema of the database.
+
+    Without a path, the schema is reflected from the database. Otherwise it's
+    loaded from the snapshot at the given path and checked against the live
+    schema in the background, without delaying the start up of the app. If the
+    snapshot doesn't exist yet, the schema is reflected and a snapshot is saved
+    on a best effort basis (the file system may be read-only).
+
+    Returns a tuple (metadata, check) where check is the SnapshotCheck of the
+    loaded snapshot or None if the schema has been reflected.
+    """
+    if not path:
+        return reflect_metadata(engine), None
+
+    snapshot = read_snapshot(path)
+    if snapshot is None:
+        metadata = reflect_metadata(engine)
+        try:
+            save_snapshot(metadata, path)
+        except OSError:
+            logger.warning('Unable to save the schema snapshot to %s', path, exc_info=True)
+        return metadata, None
+
+    check = SnapshotCheck(engine, snapshot, path)
+    check.start(delay=check_delay)
+    return snapshot['metadata'], check
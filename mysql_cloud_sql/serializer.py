@@ -0,0 +1,130 @@
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from flask import current_app
+from flask_restful import fields, marshal
+from flask_restful.representations.json import output_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_integer(value):
+    """Encode a value like fields.Integer does, None becoming its default of 0."""
+    return '0' if value is None else str(int(value))
+
+
+def encode_string(value):
+    """Encode a value like fields.String does, escaping non-ASCII characters
+    like json.dumps does by default.
+    """
+    return 'null' if value is None else encode_basestring_ascii(str(value))
+
+
+def encode_string_compact(value):
+    """Encode a value like fields.String does, keeping non-ASCII characters
+    as UTF-8 instead of escaping them.
+    """
+    if value is None:
+        return 'null'
+    if orjson is not None:
+        return orjson.dumps(str(value)).decode()
+    return encode_basestring(str(value))
+
+
+def compile_serializer(field_spec, access, compact=False):
+    """Compile a dict of flask_restful fields (like the ones passed to
+    marshal_with) into a function which turns a single row into its JSON
+    document, without building any intermediate dict.
+
+    The access argument tells how the function reads the fields of a row:
+        1. 'index'     - row[0], row[1], ... in the order of field_spec, e.g.
+                         for tuples returned by queries of individual columns.
+        2. 'item'      - row['name'], e.g. for dicts.
+        3. 'attribute' - row.name, e.g. for ORM objects.
+
+    By default the output is identical to json.dumps of the marshalled row,
+    as written by flask_restful. With compact set, the separators don't have
+    any whitespace and strings aren't ASCII escaped.
+
+    Only fields.Integer and fields.String are supported.
+    """
+    separator, colon = (',', ':') if compact else (', ', ': ')
+    namespace = {}
+    pieces = []
+    for position, (name, field) in enumerate(field_spec.items()):
+        field_class = field if isinstance(field, type) else type(field)
+        if issubclass(field_class, fields.Integer):
+            namespace[f'encode_{position}'] = encode_integer
+        elif issubclass(field_class, fields.String):
+            namespace[f'encode_{position}'] = encode_string_compact if compact else encode_string
+        else:
+            raise ValueError(f'Cannot compile a serializer for the {field_class.__name__} field {name!r}')
+
+        accessor = {'index': f'row[{position}]', 'item': f'row[{name!r}]', 'attribute': f'row.{name}'}[access]
+        prefix = ('{' if position == 0 else separator) + encode_basestring_ascii(name) + colon
+        pieces.append(f'{prefix!r} + encode_{position}({accessor})')
+
+    source = 'def serialize(row):\n    return ' + ' + '.join(pieces or ["'{'"]) + " + '}'\n"
+    exec(compile(source, '<serializer {}>'.format(', '.join(field_spec)), 'exec'), namespace)
+    return namespace['serialize']
+
+
+def uses_restful_json():
+    """Return True if the app formats its JSON documents differently than
+    json.dumps does by default, i.e. in debug mode (indented) or when
+    RESTFUL_JSON is set, in which case the documents must be written by
+    flask_restful instead.
+    """
+    return current_app.debug or bool(current_app.config.get('RESTFUL_JSON'))
+
+
+def json_separators():
+    """Return the item and key separators of the documents written by the
+    serializers, depending on the COMPACT_JSON setting of the app.
+    """
+    return (',', ':') if current_app.config.get('COMPACT_JSON') else (', ', ': ')
+
+
+class Serializer:
+    """Serializes rows into JSON documents using functions compiled once
+    from a dict of flask_restful fields, as a faster replacement for marshal_with.
+
+    The compact output is used if the COMPACT_JSON setting of the app is true.
+    The responses fall back to marshal() when uses_restful_json() is true.
+    """
+
+    def __init__(self, field_spec, access='item'):
+        self.fields = field_spec
+        self.access = access
+        self._serialize = compile_serializer(field_spec, access)
+        self._serialize_compact = compile_serializer(field_spec, access, compact=True)
+
+    def to_json(self, row, compact=None):
+        """Return the JSON document of the given row as a string, compact
+        if the COMPACT_JSON setting of the app is true unless 'compact' is
+        given (which allows using it outside of an app context).
+        """
+        if current_app.config.get('COMPACT_JSON') if compact is None else compact:
+            return self._serialize_compact(row)
+        return self._serialize(row)
+
+    def to_json_array(self, rows):
+        """Return the JSON array of the documents of the given rows as a string."""
+        if current_app.config.get('COMPACT_JSON'):
+            return '[' + ','.join(map(self._serialize_compact, rows)) + ']'
+        return '[' + ', '.join(map(self._serialize, rows)) + ']'
+
+    def response(self, row, status=200, headers=None):
+        """Return a response containing the JSON document of the given row,
+        followed by a newline like the responses of flask_restful.
+        """
+        if uses_restful_json():
+            if self.access == 'index':
+                row = dict(zip(self.fields, row))
+            return output_json(marshal(row, self.fields), status, headers)
+
+        return current_app.response_class(
+            self.to_json(row) + '\n', status=status, headers=headers, mimetype='application/json'
+        )
@@ -1,5 +1,7 @@
 import requests
+import zlib
 
+from concurrent.futures import ThreadPoolExecutor
 from json import dumps
 
 # For local testing, use the LOCAL_DEVELOPMENT_URL.
@@ -20,6 +22,7 @@ def populate_db_with_mock_data():
     on an already existing database.
 
     This function makes POST requests to populate the database with mock data. 
+    Larger data sets are better loaded with `flask members import`.
     """
     records = [
         {
@@ -37,6 +40,10 @@ def populate_db_with_mock_data():
         {
             'name': 'Vishy Anand',
             'email': 'thevish@chess.com'
+        },
+        {
+            'name': 'Zsuzsa Polgar',
+            'email': 'zsuzsa@chess.com'
         }
     ]
 
@@ -63,6 +70,26 @@ endpoint = 'members/all'
 response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
 print(pprint_json(response))
 input()
+# Paginated listing
+endpoint = 'members/all?limit=2'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+input()
+# Streamed listing with a JSON object per line
+endpoint = 'members/all?format=ndjson'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}', stream=True)
+for line in response.iter_lines():
+    print(line.decode())
+input()
+# Compressed streamed listing: the first members can be decompressed as soon
+# as the first chunk arrives, before the rest of the stream has been read
+endpoint = 'members/all?format=ndjson'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}', headers={'Accept-Encoding': 'gzip'}, stream=True)
+decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+first_chunk = next(response.raw.stream(decode_content=False))
+print(decompressor.decompress(first_chunk).decode())
+response.close()
+input()
 
 # Testing GET request of MemberRecord
 # Success
@@ -76,6 +103,22 @@ response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
 print(pprint_json(response))
 input()
 
+# Testing GET request of MemberSearch
+# Case-insensitive prefix search
+endpoint = 'members/search?q=vis&prefix=true&ci=true&limit=2'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+input()
+# Case-sensitive prefix search with a prefix ending in z, which finds
+# Zsuzsa Polgar, whereas the same prefix in lower case finds no member
+endpoint = 'members/search?q=Zsuz&prefix=true'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+endpoint = 'members/search?q=zsuz&prefix=true'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+input()
+
 # Testing POST request of MemberEntity
 endpoint = 'members/new'
 # Bad Request (400) Error
@@ -130,6 +173,20 @@ patch_data = {'name': 'Mini Mouse'}
 response = requests.patch(f'{GOOGLE_APP_ENGINE_URL}{endpoint}', data=patch_data)
 print(pprint_json(response))
 input()
+# A member fetched by two spellings of its name which the database treats as
+# equal is cached under both, and both show the update right after it
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}members/Joe')
+print(pprint_json(response))
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}members/joe')
+print(pprint_json(response))
+joe_endpoint = f'members/{response.json()["_id"]}/update'
+response = requests.patch(f'{GOOGLE_APP_ENGINE_URL}{joe_endpoint}', data={'email': 'joe.new@gmail.com'})
+print(pprint_json(response))
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}members/Joe')
+print(pprint_json(response))
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}members/joe')
+print(pprint_json(response))
+input()
 
 # Testing DELETE request of MemberRecord
 # Not Found (404) Error
@@ -143,13 +200,66 @@ response = requests.delete(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
 print(f'Response Code: {response.status_code}')
 input()
 
-# Testing DELETE request of MemberRecord
-# No Content (204) Success
+# Testing DELETE request of MemberEntity
+# Accepted (202) Success
 endpoint = 'members/delete'
 response = requests.delete(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
 print(f'Response Code: {response.status_code}')
+print(pprint_json(response))
+input()
+# Progress of the bulk delete job
+response = requests.get(response.headers['Location'])
+print(pprint_json(response))
 input()
 # Not Found (404) Error
 response = requests.delete(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
 print(f'Response Code: {response.status_code}')
 input()
+
+# Testing admission control of the members endpoints
+# Too Many Requests (429) or Service Unavailable (503) Errors, along with a 
+# Retry-After header, for the requests shed while the server is overloaded
+endpoint = 'members/all?limit=100'
+with ThreadPoolExecutor(max_workers=50) as executor:
+    responses = list(executor.map(lambda _: requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}'), range(50)))
+for response in responses:
+    print(f'Response Code: {response.status_code}, Retry-After: {response.headers.get("Retry-After")}')
+input()
+# Queue and rejections of every endpoint
+endpoint = 'internal/admission'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+input()
+# The endpoints share their slots: under load spread across two endpoints at
+# once, the peak number of requests in flight stays within max_concurrency
+endpoints = ['members/all?limit=100', 'members/Joe'] * 25
+with ThreadPoolExecutor(max_workers=50) as executor:
+    list(executor.map(lambda endpoint: requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}'), endpoints))
+endpoint = 'internal/admission'
+admission = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}').json()
+print(f'Peak in flight: {admission["peak_in_flight"]}, Max concurrency: {admission["max_concurrency"]}')
+input()
+
+# Testing coalescing of concurrent GET requests of MemberRecord
+# The loads shared by concurrent requests for the same member are counted as coalesced
+endpoint = 'members/Joe'
+with ThreadPoolExecutor(max_workers=20) as executor:
+    list(executor.map(lambda _: requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}'), range(20)))
+endpoint = 'internal/cache'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+input()
+
+# Testing GET request of MemberChangeFeed
+# The first page of the change log
+endpoint = 'members/changes?limit=5'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+next_since = response.json()['next_since']
+input()
+# Only the changes made since the previous page
+requests.patch(f'{GOOGLE_APP_ENGINE_URL}members/2/update', json={'email': 'sonal@gmail.com'})
+endpoint = f'members/changes?since={next_since}'
+response = requests.get(f'{GOOGLE_APP_ENGINE_URL}{endpoint}')
+print(pprint_json(response))
+input()
@@ -0,0 +1,82 @@
+from sqlalchemy import case, literal_column, null, text
+from sqlalchemy.dialects import mysql
+
+
+def upsert(session, table, values):
+    """Insert a row into the table, or overwrite the row having the same
+    primary key if it already exists, without reading it first.
+
+    The given values must contain the primary key along with every other
+    column to be written. Returns True if a new row has been inserted and
+    False if an existing row has been overwritten.
+
+    Raises an IntegrityError if the values conflict with another row on a
+    unique column other than the primary key.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == 'mysql':
+        return _upsert_mysql(session, table, values)
+    if dialect == 'sqlite':
+        return _upsert_sqlite(session, table, values)
+    raise NotImplementedError(f'Upserts are not supported for the {dialect} dialect')
+
+
+def _upsert_mysql(session, table, values):
+    """Upsert a row with a single INSERT ... ON DUPLICATE KEY UPDATE statement.
+
+    MySQL reports 1 affected row for an insert and 2 for an update which
+    changes the row. Callers always write a new modification time, so an
+    overwritten row is always changed.
+
+    ON DUPLICATE KEY UPDATE also fires when the row conflicts with another
+    row on a unique column other than the primary key, which must not be
+    overwritten. For such a row every column is set to NULL, which fails
+    with an integrity error as the columns are NOT NULL (given the default,
+    strict sql_mode).
+
+    The VALUES() references are built by hand because SQLAlchemy 1.3 renders
+    every 'inserted' column used inside an expression as the column being
+    assigned to.
+    """
+    (primary_key,) = table.primary_key.columns
+    quote = session.get_bind().dialect.identifier_preparer.quote
+
+    def inserted(column):
+        return literal_column(f'VALUES({quote(column)})')
+
+    same_row = primary_key == inserted(primary_key.name)
+    statement = mysql.insert(table).values(values).on_duplicate_key_update({
+        column: case([(same_row, inserted(column))], else_=null())
+        for column in values if column != primary_key.name
+    })
+
+    return session.execute(statement).rowcount == 1
+
+
+def _upsert_sqlite(session, table, values):
+    """Upsert a row with INSERT ... ON CONFLICT DO NOTHING, followed by an
+    UPDATE if the row already existed.
+
+    SQLite reports a single changed row for both outcomes of an
+    ON CONFLICT DO UPDATE, so the overwrite is done by a second statement
+    in the same transaction instead. The INSERT takes the write lock of the
+    database, so no other writer can get in between the two statements.
+    """
+    (primary_key,) = table.primary_key.columns
+    quote = session.get_bind().dialect.identifier_preparer.quote
+    columns = ', '.join(quote(column) for column in values)
+    params = ', '.join(f':{column}' for column in values)
+    statement = text(
+        f'INSERT INTO {quote(table.name)} ({columns}) VALUES ({params}) '
+        f'ON CONFLICT ({quote(primary_key.name)}) DO NOTHING'
+    )
+
+    if session.execute(statement, values).rowcount:
+        return True
+
+    session.execute(
+        table.update()
+        .where(primary_key == values[primary_key.name])
+        .values({column: value for column, value in values.items() if column != primary_key.name})
+    )
+    return False
@@ -0,0 +1,408 @@
+"""ASGI serving mode of the video API.
+
+The requests of the Video resource (/video/<int:video_id>) are handled by
+coroutines sharing a single event loop, which access the database through
+a small pool of aiosqlite connections. A client which is slow to send its
+request or to read the response only holds a coroutine, not a thread.
+
+Every other request (and any Video request which the coroutines can't
+handle identically, e.g. a form body, a query string or debug mode) is
+handed over to the Flask app of main.py, running on a bounded thread pool.
+The routes and the responses are therefore the same in both modes.
+
+Requires an ASGI server and aiosqlite, which are pinned in requirements.txt:
+    pip install -r requirements.txt
+    uvicorn asgi:application --port 5000
+
+or simply: python asgi.py
+
+NOTE: The requests handled by the coroutines aren't recorded by the
+      request metrics of the Flask app.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from sqlalchemy.engine.url import make_url
+from werkzeug.http import parse_etags, quote_etag
+
+from main import (
+    VideoModel, app, discard_from_video_leaderboards, invalidate_videos, update_video_leaderboards, video_cache,
+    video_etag, video_loads, video_put_args, video_serializer, video_update_args
+)
+from sqlite_profile import SQLITE_PRAGMAS
+from validation import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Number of connections to the database shared by the coroutines
+ASYNC_DB_POOL_SIZE = 10
+# Number of threads running the requests handed over to the Flask app
+WSGI_THREADS = 16
+
+VIDEO_PATH = re.compile(r"^/video/(\d+)$")
+VIDEO_COLUMNS = ("_id", "name", "views", "likes", "version")
+VIDEO_TABLE = VideoModel.__table__.name
+
+
+class AsyncConnectionPool:
+    """A fixed size pool of aiosqlite connections to a SQLite database, set
+    up with the given PRAGMAs. The connections are in autocommit mode, so
+    transactions have to be started explicitly.
+
+    The connections are opened by the first caller (or by open()), as they
+    belong to the event loop they're opened on.
+    """
+
+    def __init__(self, path, size, pragmas):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self._idle = None
+        self._connections = []
+        self._open_lock = None
+
+    async def open(self):
+        """Open all the connections of the pool, unless they're open."""
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self._idle is not None:
+                return
+            idle = asyncio.Queue()
+            for _ in range(self.size):
+                connection = await aiosqlite.connect(self.path, isolation_level=None)
+                for name, value in self.pragmas.items():
+                    await connection.execute(f"PRAGMA {name} = {value}")
+                self._connections.append(connection)
+                idle.put_nowait(connection)
+            self._idle = idle
+
+    async def close(self):
+        """Close all the connections of the pool."""
+        for connection in self._connections:
+            await connection.close()
+        self._connections = []
+        self._idle = None
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection for the duration of the block. A transaction
+        left open by the block is rolled back.
+        """
+        if self._idle is None:
+            await self.open()
+        connection = await self._idle.get()
+        try:
+            yield connection
+        finally:
+            if connection.in_transaction:
+                await connection.rollback()
+            self._idle.put_nowait(connection)
+
+
+def database_path(uri):
+    """Return the path of the SQLite database of the given URI, relative to
+    the app like Flask-SQLAlchemy makes it.
+    """
+    database = make_url(uri).database
+    return database if os.path.isabs(database) else os.path.join(app.root_path, database)
+
+
+db_pool = AsyncConnectionPool(database_path(app.config["SQLALCHEMY_DATABASE_URI"]), ASYNC_DB_POOL_SIZE, SQLITE_PRAGMAS)
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+class Fallback(Exception):
+    """Raised by a handler to hand the request over to the Flask app."""
+
+
+def json_response(status, document, headers=()):
+    """Return a response with the given JSON document (a string) and the
+    same headers as the responses of the Flask app.
+    """
+    body = (document + "\n").encode()
+    return status, [("Content-Type", "application/json"), ("Content-Length", str(len(body))), *headers], body
+
+
+def error_response(status, message):
+    """Return an error response like flask_restful.abort(status, message=...)."""
+    return json_response(status, json.dumps({"message": message}))
+
+
+def video_response(status, video, headers=()):
+    """Return a response with the JSON document of the given video."""
+    return json_response(status, video_serializer.to_json(video, compact=app.config.get("COMPACT_JSON")), headers)
+
+
+async def fetch_one(statement, parameters):
+    """Run a query and return its first row, or None."""
+    async with db_pool.connection() as connection:
+        async with connection.execute(statement, parameters) as cursor:
+            return await cursor.fetchone()
+
+
+async def get_video(video_id, headers, body):
+    """Asynchronous counterpart of Video.get of main.py."""
+    if_none_match = parse_etags(headers.get("if-none-match"))
+    if if_none_match:
+        cached = video_cache.get(video_id)
+        if cached:
+            version = cached["version"]
+        else:
+            row = await fetch_one(f"SELECT version FROM {VIDEO_TABLE} WHERE _id = ?", (video_id,))
+            version = row[0] if row else None
+
+        if version is not None and if_none_match.contains_weak(video_etag(video_id, version)):
+            etag = quote_etag(video_etag(video_id, version))
+            return 304, [("Content-Type", "text/html; charset=utf-8"), ("ETag", etag)], b""
+
+    video = video_cache.get(video_id)
+    if video is None:
+        # Concurrent misses share a query, like in LRUCache.get_or_load
+        generation = video_cache.current_generation()
+        row = await video_loads.do_async(
+            (video_id, generation),
+            lambda: fetch_one(f"SELECT {', '.join(VIDEO_COLUMNS)} FROM {VIDEO_TABLE} WHERE _id = ?", (video_id,))
+        )
+        if row is None:
+            return error_response(404, "Video with the given ID was not found...")
+        video = dict(zip(VIDEO_COLUMNS, row))
+        video_cache.set(video_id, video, generation)
+
+    return video_response(200, video, [("ETag", quote_etag(video_etag(video_id, video["version"])))])
+
+
+async def put_video(video_id, headers, body):
+    """Asynchronous counterpart of Video.put of main.py."""
+    args = video_put_args.validate(body)
+    video = {"_id": video_id, "name": args["name"], "views": args["views"], "likes": args["likes"], "version": 1}
+
+    async with db_pool.connection() as connection:
+        cursor = await connection.execute(
+            f"INSERT INTO {VIDEO_TABLE} ({', '.join(video)}) VALUES ({', '.join('?' * len(video))}) "
+            "ON CONFLICT (_id) DO NOTHING",
+            tuple(video.values())
+        )
+        inserted = cursor.rowcount == 1
+        await cursor.close()
+
+    if not inserted:
+        return error_response(409, "Video ID already in use...")
+
+    invalidate_videos(video_id)
+    update_video_leaderboards([video])
+    return video_response(201, video)
+
+
+async def patch_video(video_id, headers, body):
+    """Asynchronous counterpart of Video.patch of main.py. The new values
+    and the version are written by a single UPDATE, and the row is read
+    back in the same transaction.
+    """
+    args = video_update_args.validate(body)
+    changes = {column: value for column, value in args.items() if value}
+    assignments = "".join(f"{column} = ?, " for column in changes)
+
+    async with db_pool.connection() as connection:
+        await connection.execute("BEGIN IMMEDIATE")
+        cursor = await connection.execute(
+            f"UPDATE {VIDEO_TABLE} SET {assignments}version = version + 1 WHERE _id = ?",
+            (*changes.values(), video_id)
+        )
+        updated = cursor.rowcount == 1
+        await cursor.close()
+        if not updated:
+            return error_response(404, "Cannot update because video with the given ID not found...")
+
+        async with connection.execute(
+            f"SELECT {', '.join(VIDEO_COLUMNS)} FROM {VIDEO_TABLE} WHERE _id = ?", (video_id,)
+        ) as cursor:
+            video = dict(zip(VIDEO_COLUMNS, await cursor.fetchone()))
+        await connection.commit()
+
+    invalidate_videos(video_id)
+    update_video_leaderboards([video])
+    return video_response(200, video)
+
+
+async def delete_video(video_id, headers, body):
+    """Asynchronous counterpart of Video.delete of main.py."""
+    async with db_pool.connection() as connection:
+        cursor = await connection.execute(f"DELETE FROM {VIDEO_TABLE} WHERE _id = ?", (video_id,))
+        deleted = cursor.rowcount == 1
+        await cursor.close()
+
+    if not deleted:
+        return error_response(404, "Cannot delete because video with the given ID not found...")
+
+    invalidate_videos(video_id)
+    discard_from_video_leaderboards(video_id)
+    return 204, [("Content-Type", "application/json")], b""
+
+
+VIDEO_HANDLERS = {
+    "GET": get_video,
+    "PUT": put_video,
+    "PATCH": patch_video,
+    "DELETE": delete_video
+}
+
+
+def decode_json_body(headers, body):
+    """Return the JSON body of a request as a dict, or {} if there isn't
+    any body. Raise Fallback for any other kind of body, or an invalid one,
+    so that the Flask app handles (or rejects) it.
+    """
+    if not body:
+        return {}
+    mimetype = headers.get("content-type", "").split(";")[0].strip().lower()
+    if mimetype != "application/json" and not (mimetype.startswith("application/") and mimetype.endswith("+json")):
+        raise Fallback()
+    try:
+        document = json.loads(body)
+    except ValueError:
+        raise Fallback()
+    if not isinstance(document, dict):
+        raise Fallback()
+    return document
+
+
+async def handle_video(scope, video_id, body):
+    """Handle a request of the Video resource, returning (status, headers, body)."""
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+    if scope["query_string"] or app.debug or app.config.get("RESTFUL_JSON"):
+        raise Fallback()
+
+    try:
+        return await VIDEO_HANDLERS[scope["method"]](video_id, headers, decode_json_body(headers, body))
+    except ValidationError as error:
+        return error_response(400, error.message)
+    except Fallback:
+        raise
+    except Exception:
+        logger.exception("Exception on %s %s", scope["method"], scope["path"])
+        return error_response(500, "Internal Server Error")
+
+
+def build_environ(scope, body):
+    """Build the WSGI environ of an ASGI HTTP request."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def run_wsgi(environ):
+    """Run the Flask app on the given environ and return the (status,
+    headers, body) of its response.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    chunks = app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return response["status"], response["headers"], body
+
+
+async def read_body(receive):
+    """Read the whole body of a request, or return None if the client has disconnected."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def lifespan(receive, send):
+    """Open the database connections at start up and close them at shutdown."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await db_pool.open()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await db_pool.close()
+            wsgi_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        raise NotImplementedError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    match = VIDEO_PATH.match(scope["path"])
+    try:
+        if not match or scope["method"] not in VIDEO_HANDLERS:
+            raise Fallback()
+        status, headers, body = await handle_video(scope, int(match.group(1)), body)
+    except Fallback:
+        loop = asyncio.get_event_loop()
+        status, headers, body = await loop.run_in_executor(wsgi_executor, run_wsgi, build_environ(scope, body))
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# Run a local server with uvicorn
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(application, host="127.0.0.1", port=5000)
@@ -0,0 +1,136 @@
+import csv
+import json
+import time
+
+import click
+
+# Formats of the files read and written by the import and export commands
+FORMATS = ("csv", "ndjson")
+# Seconds between two progress reports of a running import or export
+PROGRESS_INTERVAL = 5.0
+
+
+def detect_format(file, format=None):
+    """Return the given format, or else the one of the extension of the
+    name of the file (NDJSON unless it ends with .csv).
+    """
+    if format is not None:
+        return format
+    return "csv" if getattr(file, "name", "").lower().endswith(".csv") else "ndjson"
+
+
+def read_records(file, format, record_fields):
+    """Generator which reads the records of a CSV file (with a header row)
+    or of an NDJSON file one at a time and yields them as dicts.
+
+    record_fields maps the name of every field to a (type, required) pair.
+    Fields which are neither required nor present are left out of the
+    records and other fields are ignored. Raise a click.ClickException
+    pointing at the line of a record which misses a required field or has
+    a value of the wrong type.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        missing = [name for name, (_, required) in record_fields.items() if required and name not in (reader.fieldnames or ())]
+        if missing:
+            raise click.ClickException(f"The CSV file has no column named {', '.join(missing)}")
+        rows = ((reader.line_num, row) for row in reader)
+    else:
+        rows = ((line_number, _parse_json_line(line, line_number)) for line_number, line in enumerate(file, 1) if line.strip())
+
+    for line_number, row in rows:
+        record = {}
+        for name, (field_type, required) in record_fields.items():
+            value = row.get(name)
+            if value is None or (value == "" and format == "csv"):
+                if required:
+                    raise click.ClickException(f"Line {line_number}: {name} is required")
+                continue
+            try:
+                record[name] = _convert(value, field_type)
+            except (TypeError, ValueError):
+                raise click.ClickException(f"Line {line_number}: {name} should be of type {field_type.__name__}")
+        yield record
+
+
+def write_records(file, format, field_names, rows):
+    """Write rows (tuples of the values of the given fields) to a CSV file
+    (with a header row) or to an NDJSON file, and return their number.
+    """
+    count = 0
+    if format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(field_names)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            file.write(json.dumps(dict(zip(field_names, row)), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def batched(iterable, size):
+    """Generator which yields the items of an iterable in lists of at most size items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Progress:
+    """Reports the number of rows processed by a command and its rate in
+    rows per second on stderr, every PROGRESS_INTERVAL seconds and once
+    it's done.
+    """
+
+    def __init__(self, action, noun):
+        self.action = action
+        self.noun = noun
+        self.rows = 0
+        self._started = self._reported = time.perf_counter()
+
+    def add(self, rows):
+        """Count rows which have been processed."""
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            self._report(now, f"{self.action} {self.rows} {self.noun} so far")
+
+    def done(self):
+        """Report the total number of rows processed."""
+        self._report(time.perf_counter(), f"{self.action} {self.rows} {self.noun}")
+
+    def _report(self, now, message):
+        elapsed = now - self._started
+        rate = self.rows / elapsed if elapsed > 0 else 0.0
+        click.echo(f"{message} in {elapsed:.1f} s ({rate:.0f} rows/s)", err=True)
+
+
+def _parse_json_line(line, line_number):
+    try:
+        row = json.loads(line)
+    except ValueError:
+        raise click.ClickException(f"Line {line_number}: not a valid JSON document")
+    if not isinstance(row, dict):
+        raise click.ClickException(f"Line {line_number}: should be a JSON object")
+    return row
+
+
+def _convert(value, field_type):
+    """Convert a value read from a file to the type of its field. Strings
+    (read from CSV files) are parsed, other values must have the type already.
+    """
+    if isinstance(value, str):
+        return field_type(value)
+    if field_type is int and (not isinstance(value, int) or isinstance(value, bool)):
+        raise TypeError(value)
+    if field_type is str:
+        raise TypeError(value)
+    return value
@@ -0,0 +1,94 @@
+import zlib
+
+from flask import request
+
+# Window bits of zlib.compressobj for each supported content coding: gzip
+# adds the gzip header and trailer, deflate is the zlib format (RFC 1950).
+ENCODINGS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS
+}
+
+# Media types worth compressing (along with any text/* and +json type)
+COMPRESSIBLE_MIMETYPES = frozenset(("application/json", "application/x-ndjson", "application/javascript"))
+
+
+class ResponseCompressor:
+    """Compresses the responses of a Flask app with gzip or deflate,
+    depending on the Accept-Encoding header of the request.
+
+    Responses smaller than min_size bytes are sent as they are, as
+    compressing them costs more CPU than the bytes it saves. Streamed
+    responses don't have a known size, so they're always compressed, on the
+    fly while they're being streamed: the compressed data of every chunk is
+    flushed, so that the client gets it without waiting for the next chunks.
+
+    The level goes from 1 (fastest) to 9 (smallest output). The ETag of a
+    compressed response is made weak, as the compressed bytes differ from
+    the ones the strong ETag was computed for; If-None-Match checks are
+    weak comparisons so they still match it.
+    """
+
+    def __init__(self, app=None, min_size=1024, level=6):
+        self.min_size = min_size
+        self.level = level
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the hook compressing the responses of the app."""
+        app.after_request(self.compress)
+
+    def compress(self, response):
+        """Compress the response if the client accepts it and it's worth it."""
+        if (
+            response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or "Content-Encoding" in response.headers
+            or request.method == "HEAD" or not is_compressible(response.mimetype)
+        ):
+            return response
+        if not response.is_streamed and response.calculate_content_length() < self.min_size:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(tuple(ENCODINGS))
+        if encoding is None:
+            return response
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, ENCODINGS[encoding])
+        if response.is_streamed:
+            response.response = compress_stream(response.response, compressor, response.charset)
+            response.headers.pop("Content-Length", None)
+        else:
+            response.set_data(compressor.compress(response.get_data()) + compressor.flush())
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def is_compressible(mimetype):
+    """Return True if responses of the given media type are worth compressing."""
+    return mimetype in COMPRESSIBLE_MIMETYPES or mimetype.startswith("text/") or mimetype.endswith("+json")
+
+
+def compress_stream(chunks, compressor, charset):
+    """Compress a streamed body chunk by chunk, closing the original
+    iterable (e.g. to end a stream_with_context) when done.
+
+    Every chunk is followed by a sync flush, which ends its compressed data
+    on a byte boundary so that it can be decompressed as soon as it's
+    received, at the cost of a few bytes per chunk.
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
@@ -0,0 +1,126 @@
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class CounterAggregator:
+    """Buffers increments of counters in memory and hands them over, summed
+    per key, to a flush function which writes them to the database.
+
+    The buffered increments are flushed by a background thread every
+    'interval' seconds, as soon as 'max_pending' increments are buffered
+    and when the interpreter exits. The last two settings bound how many
+    increments are lost if the process dies without flushing.
+
+    If a flush fails, its increments are put back into the buffer so that
+    they're retried by the next flush.
+    """
+
+    def __init__(self, flush, interval=1.0, max_pending=1000):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._flush = flush
+        self._pending = defaultdict(Counter)
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_increments = 0
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def add(self, key, field, amount=1):
+        """Buffer an increment of the given field of the given key."""
+        with self._lock:
+            self._pending[key][field] += amount
+            self._pending_count += 1
+            if self._pending_count >= self.max_pending:
+                self._wakeup.set()
+
+        if self._thread is None:
+            self._start()
+
+    def flush(self):
+        """Write all the buffered increments using the flush function and
+        return the number of increments which were flushed.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(Counter)
+                count, self._pending_count = self._pending_count, 0
+
+            if not pending:
+                return 0
+
+            try:
+                self._flush(pending)
+            except Exception:
+                with self._lock:
+                    for key, counter in pending.items():
+                        self._pending[key].update(counter)
+                    self._pending_count += count
+                    self.failed_flushes += 1
+                raise
+
+            self.flushes += 1
+            self.flushed_increments += count
+            return count
+
+    def stats(self):
+        """Return a dict containing the settings and the counters of the aggregator."""
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "max_pending": self.max_pending,
+                "pending": self._pending_count,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "flushed_increments": self.flushed_increments
+            }
+
+    def _start(self):
+        """Start the background thread flushing the buffered increments.
+
+        The thread is started by the first increment rather than on creation
+        so that processes which never count anything don't run it.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="counter-aggregator", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _reset_after_fork(self):
+        """Start over in a process forked from this one (e.g. a worker of
+        prefork.py). The buffered increments are left to the parent to flush,
+        and the flushing thread, which isn't running in the child, is started
+        again by the next increment.
+        """
+        self._pending = defaultdict(Counter)
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        """Flush the buffered increments every interval or whenever too
+        many of them are buffered.
+        """
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush the buffered counter increments")
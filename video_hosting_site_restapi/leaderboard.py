@@ -0,0 +1,154 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+    """A thread-safe, in-memory ranking of the 'capacity' keys with the
+    highest scores, e.g. the most viewed videos.
+
+    The ranking is loaded by calling load(limit), which should return the
+    'limit' highest scoring (key, score) pairs, e.g. from a query served by
+    an index. After that it's kept up to date by reporting the new score of
+    every key which is written with update() and every deleted key with
+    discard(), so reading it doesn't touch the database.
+
+    Keys outside the ranking are only known to score lower than the ones
+    in it. A key whose score drops below the rest of the ranking is therefore
+    dropped from it, and the ranking is reloaded once it holds fewer keys
+    than are asked for (the capacity should leave a margin above the largest
+    n passed to top() for that). It's also reloaded every 'max_age' seconds,
+    which bounds how long writes which aren't reported (e.g. made by another
+    process) are missing from it.
+
+    Ties are broken by the key, the greatest first.
+    """
+
+    def __init__(self, load, capacity=200, max_age=60.0, clock=time.monotonic):
+        self.capacity = capacity
+        self.max_age = max_age
+        self._load = load
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Held while loading so that concurrent readers wait for a single load
+        self._load_lock = threading.Lock()
+        self._scores = {}
+        # (score, key) pairs of the ranking in ascending order
+        self._ranking = []
+        # True if the ranking holds every key i.e., no key scores lower
+        self._complete = False
+        self._loaded_at = None
+        # Writes reported while loading, replayed on top of the loaded ranking
+        self._replay = None
+
+        self.loads = 0
+        self.updates = 0
+        self.evictions = 0
+
+    def top(self, n):
+        """Return the n (at most 'capacity') highest scoring (key, score)
+        pairs, the highest first, loading the ranking first if needed.
+        """
+        n = min(n, self.capacity)
+        with self._lock:
+            if self._is_usable(n):
+                return self._top(n)
+
+        with self._load_lock:
+            with self._lock:
+                if self._is_usable(n):
+                    return self._top(n)
+                self._replay = []
+
+            try:
+                rows = self._load(self.capacity)
+            except BaseException:
+                with self._lock:
+                    self._replay = None
+                raise
+
+            with self._lock:
+                replay, self._replay = self._replay, None
+                self._scores = {key: score for key, score in rows}
+                self._ranking = sorted((score, key) for key, score in self._scores.items())
+                self._complete = len(rows) < self.capacity
+                self._loaded_at = self._clock()
+                self.loads += 1
+                for key, score in replay:
+                    self._apply(key, score)
+                return self._top(n)
+
+    def update(self, key, score):
+        """Report the new score of a key which has been written."""
+        with self._lock:
+            self.updates += 1
+            if self._replay is not None:
+                self._replay.append((key, score))
+            self._apply(key, score)
+
+    def discard(self, *keys):
+        """Report keys which have been deleted."""
+        with self._lock:
+            for key in keys:
+                if self._replay is not None:
+                    self._replay.append((key, None))
+                self._apply(key, None)
+
+    def invalidate(self):
+        """Make the next call to top() reload the ranking."""
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self):
+        """Return a dict containing the configuration, the current size
+        and the counters of the leaderboard.
+        """
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "max_age": self.max_age,
+                "size": len(self._ranking),
+                "complete": self._complete,
+                "loads": self.loads,
+                "updates": self.updates,
+                "evictions": self.evictions
+            }
+
+    def _is_usable(self, n):
+        """Return True if the ranking is loaded, fresh and holds n keys.
+        Must be called with the lock held.
+        """
+        return (
+            self._loaded_at is not None and self._clock() - self._loaded_at < self.max_age
+            and (self._complete or len(self._ranking) >= n)
+        )
+
+    def _top(self, n):
+        """Return the n highest scoring pairs. Must be called with the lock held."""
+        if n <= 0:
+            return []
+        return [(key, score) for score, key in reversed(self._ranking[-n:])]
+
+    def _apply(self, key, score):
+        """Move a key to the position of its new score, or remove it if the
+        score is None. Must be called with the lock held.
+        """
+        # Every key outside of an incomplete ranking scores lower than its
+        # lowest entry, so a key scoring lower than that entry (before the
+        # key is moved) may rank below some of them and is left out.
+        lowest = self._ranking[0] if self._ranking else None
+        old_score = self._scores.pop(key, None)
+        if old_score is not None:
+            del self._ranking[bisect_left(self._ranking, (old_score, key))]
+        if score is None:
+            return
+        if not self._complete and (lowest is None or (score, key) < lowest):
+            return
+
+        self._scores[key] = score
+        insort(self._ranking, (score, key))
+        if len(self._ranking) > self.capacity:
+            _, lowest_key = self._ranking.pop(0)
+            del self._scores[lowest_key]
+            self._complete = False
+            self.evictions += 1
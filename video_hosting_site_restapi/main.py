@@ -1,13 +1,91 @@
-from flask import Flask
-from flask_restful import Api, Resource, reqparse, abort, fields, marshal_with
-from flask_sqlalchemy import SQLAlchemy
+import os
+from collections import defaultdict
+
+import click
+from flask import Flask, Response, request
+from flask.cli import AppGroup
+from flask_restful import Api, Resource, reqparse, abort, fields, marshal
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.exc import IntegrityError
+from werkzeug.http import quote_etag
+
+from bulk import FORMATS, Progress, batched, detect_format, read_records, write_records
+from cache import LRUCache
+from compression import ResponseCompressor
+from counters import CounterAggregator
+from invalidation import InvalidationChannel
+from leaderboard import Leaderboard
+from metrics import RequestMetrics
+from serializer import Serializer
+from singleflight import SingleFlight
+from sqlite_profile import SQLITE_ENGINE_OPTIONS, TunedSQLAlchemy
+from validation import Field, RequestValidator
 
 # App Configuration
 app = Flask(__name__)
 api = Api(app)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# Write JSON documents without whitespace and with non-ASCII characters
+# unescaped, instead of the output of json.dumps with its default settings.
+app.config['COMPACT_JSON'] = False
+# Pool connections across the threads of the server and set up every
+# connection with the PRAGMAs of sqlite_profile (WAL journaling and co.)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = SQLITE_ENGINE_OPTIONS
+db = TunedSQLAlchemy(app)
+
+# Worker processes forked from this one (e.g. by prefork.py) can't share its
+# connections, so every worker starts with a new pool.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: db.get_engine(app).dispose())
+
+# Requests taking longer than this many seconds are logged along with their
+# SQL statements (None disables the slow request log).
+SLOW_REQUEST_THRESHOLD = None
+
+# Latency and SQL statements of every request, exposed at /metrics
+request_metrics = RequestMetrics(app, slow_request_threshold=SLOW_REQUEST_THRESHOLD)
+
+# Responses of at least COMPRESSION_MIN_SIZE bytes (e.g. batches, but not
+# single videos) are compressed with gzip/deflate at COMPRESSION_LEVEL (1-9)
+# when the client accepts it.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVEL = 6
+response_compressor = ResponseCompressor(app, min_size=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVEL)
+
+# Maximum number of operations (or video IDs) accepted in a single batch request
+VIDEO_BATCH_MAX_SIZE = 500
+
+# Concurrent cache misses of the same video share a single query, with at
+# most VIDEO_LOAD_MAX_WAITERS requests waiting for it (see singleflight.py).
+VIDEO_LOAD_MAX_WAITERS = 100
+video_loads = SingleFlight(max_waiters=VIDEO_LOAD_MAX_WAITERS)
+
+# Cache of the videos served by GET requests, keyed by the video ID.
+# Entries are invalidated by every request which modifies a video, in every
+# worker process (see invalidate_videos).
+video_cache = LRUCache(max_size=10000, ttl=300, single_flight=video_loads)
+
+# Channel through which the worker processes of prefork.py tell each other
+# which videos they have written (see invalidation.py).
+invalidation_channel = InvalidationChannel()
+
+# Mode used to apply the increments made by the view/like endpoints:
+#   1. "write_behind" - Buffer the increments in memory and apply them in
+#                       batches every VIDEO_COUNTER_FLUSH_INTERVAL seconds or
+#                       as soon as VIDEO_COUNTER_MAX_PENDING increments are buffered.
+#   2. "sync"         - Apply every increment with its own UPDATE before responding.
+VIDEO_COUNTER_MODE = "write_behind"
+VIDEO_COUNTER_FLUSH_INTERVAL = 1.0
+VIDEO_COUNTER_MAX_PENDING = 1000
+
+# Maximum number of videos listed by /videos/top. The leaderboards behind it
+# keep VIDEO_TOP_CAPACITY videos in memory (the margin lets videos drop out
+# of them before they have to be reloaded) and are reloaded from the indexes
+# on views and likes at least every VIDEO_TOP_MAX_AGE seconds.
+VIDEO_TOP_MAX_N = 100
+VIDEO_TOP_CAPACITY = 2 * VIDEO_TOP_MAX_N
+VIDEO_TOP_MAX_AGE = 60
 
 
 # Models for the Database
@@ -16,25 +94,47 @@ class VideoModel(db.Model):
 
     _id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    views = db.Column(db.Integer, nullable=False)
-    likes = db.Column(db.Integer, nullable=False)
+    # Indexed for the /videos/top leaderboards
+    views = db.Column(db.Integer, nullable=False, index=True)
+    likes = db.Column(db.Integer, nullable=False, index=True)
+    # Incremented every time the video is modified, used to build its ETag.
+    version = db.Column(db.Integer, nullable=False, default=1)
 
     def __repr__(self):
         """Object representation of a record of VideoModel"""
         return f"Video(name = {self.name}, views = {self.views}, likes = {self.likes})"
 
 
-# Intializing Request Parser for PUT request on a Video resource
-video_put_args = reqparse.RequestParser()
-video_put_args.add_argument("name", type=str, help="Name of the video is required", required=True)
-video_put_args.add_argument("views", type=int, help="Views of the video is required", required=True)
-video_put_args.add_argument("likes", type=int, help="Likes on the video is required", required=True)
+# Intializing Request Validator for PUT request on a Video resource
+video_put_args = RequestValidator({
+    "name": Field(str, required=True, help="Name of the video is required"),
+    "views": Field(int, required=True, help="Views of the video is required"),
+    "likes": Field(int, required=True, help="Likes on the video is required")
+})
+
+# Intializing Request Validator for PATCH request on a Video resource
+video_update_args = RequestValidator({
+    "name": Field(str, help="New name of the video"),
+    "views": Field(int, help="New view count of the video"),
+    "likes": Field(int, help="New number of likes on the video")
+})
+
+# Intializing Request Parser for GET request on a batch of Video resources
+video_batch_get_args = reqparse.RequestParser()
+video_batch_get_args.add_argument("ids", type=str, location="args", help="Comma separated list of video IDs is required", required=True)
 
-# Intializing Request Parser for PATCH request on a Video resource
-video_update_args = reqparse.RequestParser()
-video_update_args.add_argument("name", type=str, help="New name of the video")
-video_update_args.add_argument("views", type=int, help="New view count of the video")
-video_update_args.add_argument("likes", type=int, help="New number of likes on the video")
+# Intializing Request Parser for GET request on the top videos
+video_top_args = reqparse.RequestParser()
+video_top_args.add_argument("by", type=str, location="args", choices=("views", "likes"), default="views",
+    help="Videos can be ranked by views or likes")
+video_top_args.add_argument("n", type=int, location="args", default=10, help="Number of videos should be an integer")
+
+# Types of the fields of a video accepted by a batch of PUT/PATCH operations
+video_batch_fields = {
+    "name": str,
+    "views": int,
+    "likes": int
+}
 
 # Resource fields to specify how objects needs to be serialized
 resource_fields = {
@@ -44,24 +144,187 @@ resource_fields = {
     "likes": fields.Integer
 }
 
+# Serializers compiled from the resource fields for videos given as dicts
+# (e.g. by the video cache) and as VideoModel objects.
+video_serializer = Serializer(resource_fields)
+video_model_serializer = Serializer(resource_fields, access="attribute")
+
+
+def load_videos(video_ids):
+    """Fetch all the videos with the given IDs using a single query.
+
+    Returns a dict mapping the ID of every video that was found to a dict
+    containing its columns.
+    """
+    if not video_ids:
+        return {}
+
+    query = db.session.query(VideoModel._id, VideoModel.name, VideoModel.views, VideoModel.likes, VideoModel.version)
+    return {row._id: row._asdict() for row in query.filter(VideoModel._id.in_(video_ids))}
+
+
+def insert_video_if_absent(video):
+    """Insert the given video (a dict containing every column) with a single
+    INSERT ... ON CONFLICT DO NOTHING statement and return whether it has been
+    inserted, i.e. False if a video with the same ID already exists.
+    """
+    table = VideoModel.__table__
+    quote = db.engine.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(column) for column in video)
+    params = ", ".join(f":{column}" for column in video)
+    statement = text(
+        f"INSERT INTO {quote(table.name)} ({columns}) VALUES ({params}) ON CONFLICT ({quote('_id')}) DO NOTHING"
+    )
+
+    return db.session.execute(statement, video).rowcount == 1
+
+
+def video_etag(video_id, version):
+    """Return the (unquoted) ETag of the given version of a video."""
+    return f"{video_id}-{version}"
+
+
+def load_video_ranking(column):
+    """Return the load function of the leaderboard of the given column
+    of VideoModel, which fetches the highest ranking videos by walking the
+    index on the column backwards rather than scanning the table.
+    """
+    def load(limit):
+        query = db.session.query(VideoModel._id, column).order_by(column.desc(), VideoModel._id.desc()).limit(limit)
+        return [tuple(row) for row in query]
+
+    return load
+
+
+# Leaderboards of the videos with the most views and likes, keyed by the
+# column they rank the videos by. Every request which writes the views or
+# likes of a video reports the new values to them.
+video_leaderboards = {
+    column: Leaderboard(
+        load_video_ranking(getattr(VideoModel, column)), capacity=VIDEO_TOP_CAPACITY, max_age=VIDEO_TOP_MAX_AGE
+    )
+    for column in ("views", "likes")
+}
+
+
+def invalidate_videos(*video_ids):
+    """Remove the given videos from the video cache of this process and,
+    through the invalidation channel, of every other worker process.
+    """
+    video_cache.invalidate(*video_ids)
+    invalidation_channel.publish("videos", video_ids)
+
+
+def update_video_leaderboards(videos):
+    """Report the current views and likes of the given videos (mappings
+    containing at least those columns and the _id) to the leaderboards of
+    every worker process.
+    """
+    scores = [[video["_id"], video["views"], video["likes"]] for video in videos]
+    if scores:
+        apply_video_scores(scores)
+        invalidation_channel.publish("video_scores", scores)
+
+
+def discard_from_video_leaderboards(*video_ids):
+    """Remove deleted videos from the leaderboards of every worker process."""
+    scores = [[video_id, None, None] for video_id in video_ids]
+    apply_video_scores(scores)
+    invalidation_channel.publish("video_scores", scores)
+
+
+def apply_video_scores(scores):
+    """Apply [video_id, views, likes] lists, where the counts of a deleted
+    video are None, to the leaderboards of this process.
+    """
+    for video_id, views, likes in scores:
+        if views is None:
+            for leaderboard in video_leaderboards.values():
+                leaderboard.discard(video_id)
+        else:
+            video_leaderboards["views"].update(video_id, views)
+            video_leaderboards["likes"].update(video_id, likes)
+
+
+def reload_video_leaderboards():
+    """Make the leaderboards of this process reload on their next read."""
+    for leaderboard in video_leaderboards.values():
+        leaderboard.invalidate()
+
+
+# Apply the writes made by the other worker processes
+invalidation_channel.subscribe("videos", lambda video_ids: video_cache.invalidate(*video_ids), reset=video_cache.clear)
+invalidation_channel.subscribe("video_scores", apply_video_scores, reset=reload_video_leaderboards)
+
+
+def flush_video_counters(pending):
+    """Apply the increments buffered by the counter aggregator, given as
+    a dict mapping video IDs to Counters of views and likes.
+
+    Every counter is incremented by the database itself (views = views + n)
+    so no increment is lost to concurrent writers, and all the videos are
+    updated by a single executemany statement in one transaction. The new
+    counts are read back in the same transaction for the leaderboards.
+    """
+    table = VideoModel.__table__
+    statement = (
+        table.update()
+        .where(table.c._id == bindparam("video_id"))
+        .values(
+            views=table.c.views + bindparam("views_delta"),
+            likes=table.c.likes + bindparam("likes_delta"),
+            version=table.c.version + 1
+        )
+    )
+
+    with db.engine.begin() as connection:
+        connection.execute(statement, [
+            {"video_id": video_id, "views_delta": counter["views"], "likes_delta": counter["likes"]}
+            for video_id, counter in pending.items()
+        ])
+        counts = connection.execute(
+            select([table.c._id, table.c.views, table.c.likes]).where(table.c._id.in_(list(pending)))
+        ).fetchall()
+    invalidate_videos(*pending)
+    update_video_leaderboards(counts)
+
+
+video_counters = CounterAggregator(
+    flush_video_counters, interval=VIDEO_COUNTER_FLUSH_INTERVAL, max_pending=VIDEO_COUNTER_MAX_PENDING
+)
+
 
 class Video(Resource):
     """Handles all requests related to the endpoint: /video/<int:video_id>"""
 
-    @marshal_with(resource_fields)
     def get(self, video_id):
         """Handles the GET request and takes in a single URL paramter
         video_id which is an Integer.
 
         Return a dict giving information about a video with the given
-        Video ID.
+        Video ID along with its ETag. Videos are served from the video
+        cache when possible.
+
+        If the request contains an If-None-Match header matching the
+        current ETag of the video, return 304 with an empty body instead.
+        In that case only the version of the video is looked up, either in
+        the cache or in the database, without loading the rest of the row.
         """
-        result = VideoModel.query.filter_by(_id=video_id).first()
+        if request.if_none_match:
+            cached = video_cache.get(video_id)
+            if cached:
+                version = cached["version"]
+            else:
+                version = db.session.query(VideoModel.version).filter_by(_id=video_id).scalar()
+
+            if version is not None and request.if_none_match.contains_weak(video_etag(video_id, version)):
+                return Response(status=304, headers={"ETag": quote_etag(video_etag(video_id, version))})
+
+        result = video_cache.get_or_load(video_id, lambda: load_videos([video_id]).get(video_id))
         if not result:
             abort(404, message="Video with the given ID was not found...")
-        return result
+        return video_serializer.response(result, 200, {"ETag": quote_etag(video_etag(video_id, result["version"]))})
 
-    @marshal_with(resource_fields)
     def put(self, video_id):
         """Handle PUT requests at the URL registered for
         the resource and creates a new video item into the
@@ -69,19 +332,24 @@ class Video(Resource):
 
         Returns the response as a dict along with 201 HTTP
         status code (which denotes that a resource has been created').
+
+        Abort if a video with the given video ID already exists, returning
+        a 409 error code. The existence check and the insert are done by
+        a single statement and the response is built from the inserted values.
         """
-        args = video_put_args.parse_args()
-        result = VideoModel.query.filter_by(_id=video_id).first()
+        args = video_put_args.parse()
+        video = {"_id": video_id, "name": args["name"], "views": args["views"], "likes": args["likes"], "version": 1}
+
+        inserted = insert_video_if_absent(video)
+        db.session.commit()
 
-        if result:
+        if not inserted:
             abort(409, message="Video ID already in use...")
 
-        video = VideoModel(_id=video_id, name=args["name"], views=args["views"], likes=args["likes"])
-        db.session.add(video)
-        db.session.commit()
-        return video, 201
+        invalidate_videos(video_id)
+        update_video_leaderboards([video])
+        return video_serializer.response(video, 201)
 
-    @marshal_with(resource_fields)
     def patch(self, video_id):
         """Handles PATCH requests at the resource's specified endpoint
         and modifies the data of an existing record.
@@ -92,7 +360,7 @@ class Video(Resource):
         Returns the response as a dict which will be serialized into JSON
         along with the 200 HTTP status code for a successful modification.
         """
-        args = video_update_args.parse_args()
+        args = video_update_args.parse()
         result = VideoModel.query.filter_by(_id=video_id).first()
         if not result:
             abort(404, message="Cannot update because video with the given ID not found...")
@@ -104,11 +372,14 @@ class Video(Resource):
             result.views = args["views"]
         if args["likes"]:
             result.likes = args["likes"]
+        result.version += 1
 
         db.session.add(result)
         db.session.commit()
+        invalidate_videos(video_id)
+        update_video_leaderboards([{"_id": video_id, "views": result.views, "likes": result.likes}])
 
-        return result
+        return video_model_serializer.response(result)
 
     def delete(self, video_id):
         """Handle DELETE requests at the URL registered for
@@ -128,12 +399,419 @@ class Video(Resource):
         
         db.session.delete(result)
         db.session.commit()
+        invalidate_videos(video_id)
+        discard_from_video_leaderboards(video_id)
         
         return '', 204
 
 
+def parse_batch_operation(op, item):
+    """Validate a single operation of a batch.
+
+    An operation of a DELETE batch is just a video ID whereas PUT and PATCH
+    operations are objects containing the 'video_id' along with the fields of
+    the video. All the fields are required for a PUT operation.
+
+    Returns a tuple (video_id, fields, error) where error is a message
+    describing the problem with the operation or None if it's valid.
+    """
+    if op == "delete":
+        if not isinstance(item, int) or isinstance(item, bool):
+            return None, None, "Video ID should be an integer"
+        return item, {}, None
+
+    if not isinstance(item, dict):
+        return None, None, "Operation should be an object containing the video_id and the fields of the video"
+
+    video_id = item.get("video_id")
+    if not isinstance(video_id, int) or isinstance(video_id, bool):
+        return None, None, "video_id is required and should be an integer"
+
+    video_fields = {}
+    for field, value in item.items():
+        if field == "video_id":
+            continue
+        if field not in video_batch_fields:
+            return video_id, None, f"Unknown field: {field}"
+        if value is None:
+            continue
+        if not isinstance(value, video_batch_fields[field]) or isinstance(value, bool):
+            return video_id, None, f"{field} should be of type {video_batch_fields[field].__name__}"
+        video_fields[field] = value
+
+    if op == "put":
+        missing = [field for field in video_batch_fields if field not in video_fields]
+        if missing:
+            return video_id, None, f"Missing required fields: {', '.join(missing)}"
+
+    return video_id, video_fields, None
+
+
+class VideoCounter(Resource):
+    """Handles all requests related to the endpoints:
+        1. /video/<int:video_id>/view
+        2. /video/<int:video_id>/like
+
+    The column incremented by a request is passed in by the endpoint
+    through the resource_class_kwargs.
+    """
+
+    def __init__(self, column):
+        self.column = column
+
+    def post(self, video_id):
+        """Handles POST requests which increment the views (or likes)
+        of a video by one.
+
+        In the "write_behind" mode the increment is buffered and applied
+        later along with the other increments, returning 202 to signal that
+        it has been accepted. In the "sync" mode it's applied immediately,
+        returning 204.
+
+        Abort if no video with the given video ID exists in the database,
+        returning a 404 error code along with an error message.
+        """
+        if VIDEO_COUNTER_MODE == "sync":
+            table = VideoModel.__table__
+            result = db.session.execute(
+                table.update()
+                .where(table.c._id == video_id)
+                .values({self.column: table.c[self.column] + 1, "version": table.c.version + 1})
+            )
+            counts = db.session.query(VideoModel._id, VideoModel.views, VideoModel.likes).filter_by(_id=video_id).first()
+            db.session.commit()
+            if not result.rowcount:
+                abort(404, message="Video with the given ID was not found...")
+            invalidate_videos(video_id)
+            update_video_leaderboards([counts._asdict()])
+            return '', 204
+
+        if not video_cache.get_or_load(video_id, lambda: load_videos([video_id]).get(video_id)):
+            abort(404, message="Video with the given ID was not found...")
+
+        video_counters.add(video_id, self.column)
+        return '', 202
+
+
+class VideoBatch(Resource):
+    """Handles all requests related to the endpoint: /videos/batch
+
+    Every video referenced by a batch is looked up with a single query and
+    the writes are applied with a single statement per kind of operation
+    inside one transaction, rather than making a round trip and a commit
+    for every video.
+
+    The response contains a result for every operation, in the same order
+    as in the request, along with the status code that the equivalent request
+    to /video/<int:video_id> would have returned.
+    """
+
+    def get(self):
+        """Handles GET requests which take a comma separated list of
+        video IDs in the 'ids' query string parameter.
+
+        Returns a dict containing the details of every video (or a 404
+        status if it doesn't exist) in the order of the given IDs.
+
+        Abort with a 400 error code if the IDs aren't valid integers or
+        if too many IDs are given.
+        """
+        args = video_batch_get_args.parse_args()
+        try:
+            video_ids = [int(video_id) for video_id in args["ids"].split(",")]
+        except ValueError:
+            abort(400, message="Video IDs should be a comma separated list of integers...")
+
+        if len(video_ids) > VIDEO_BATCH_MAX_SIZE:
+            abort(400, message=f"Cannot get more than {VIDEO_BATCH_MAX_SIZE} videos in a single batch...")
+
+        videos = load_videos(set(video_ids))
+
+        results = []
+        for video_id in video_ids:
+            if video_id in videos:
+                results.append({"video_id": video_id, "status": 200, "video": marshal(videos[video_id], resource_fields)})
+            else:
+                results.append({"video_id": video_id, "status": 404, "message": "Video with the given ID was not found..."})
+
+        return {"results": results}
+
+    def post(self):
+        """Handles POST requests containing a JSON object with the lists
+        of operations to perform, for example:
+
+            {
+                "put": [{"video_id": 1, "name": "...", "views": 10, "likes": 2}],
+                "patch": [{"video_id": 2, "views": 99}],
+                "delete": [3, 4]
+            }
+
+        A video ID can only appear once in a batch. Invalid operations are
+        reported with a 400 status while the rest of the batch is still applied.
+        All the valid operations are committed together in a single transaction.
+        A put whose video is created by another request after the batch has
+        looked it up is reported with a 409 status, like any other put of an
+        existing video.
+
+        Abort with a 400 error code if the body isn't in the above format or
+        if it contains too many operations.
+        """
+        batch = request.get_json(silent=True)
+        if not isinstance(batch, dict) or not set(batch) <= {"put", "patch", "delete"}:
+            abort(400, message="Batch should be a JSON object containing 'put', 'patch' and/or 'delete' lists...")
+
+        operations = []
+        for op in ("put", "patch", "delete"):
+            items = batch.get(op, [])
+            if not isinstance(items, list):
+                abort(400, message=f"'{op}' should be a list of operations...")
+            operations.extend((op, item) for item in items)
+
+        if len(operations) > VIDEO_BATCH_MAX_SIZE:
+            abort(400, message=f"Cannot perform more than {VIDEO_BATCH_MAX_SIZE} operations in a single batch...")
+
+        results = [None] * len(operations)
+        valid_operations = []
+        seen_ids = set()
+        for index, (op, item) in enumerate(operations):
+            video_id, video_fields, error = parse_batch_operation(op, item)
+            if error is None and video_id in seen_ids:
+                error = "Video ID appears more than once in the batch"
+            if error:
+                results[index] = {"op": op, "video_id": video_id, "status": 400, "message": error}
+                continue
+
+            seen_ids.add(video_id)
+            valid_operations.append((index, op, video_id, video_fields))
+
+        videos = load_videos(seen_ids)
+
+        # Rows to insert, parameters of the updates grouped by the set of
+        # columns they modify, the IDs of the videos to delete and the
+        # videos with new views/likes for the leaderboards.
+        inserts = []
+        updates = defaultdict(list)
+        deletes = []
+        ranked = []
+        for index, op, video_id, video_fields in valid_operations:
+            video = videos.get(video_id)
+
+            if op == "put":
+                if video:
+                    results[index] = {"op": op, "video_id": video_id, "status": 409, "message": "Video ID already in use..."}
+                    continue
+                video = dict(video_fields, _id=video_id, version=1)
+                inserts.append((index, video))
+                ranked.append(video)
+                results[index] = {"op": op, "video_id": video_id, "status": 201, "video": marshal(video, resource_fields)}
+
+            elif op == "patch":
+                if not video:
+                    results[index] = {"op": op, "video_id": video_id, "status": 404,
+                        "message": "Cannot update because video with the given ID not found..."}
+                    continue
+                if video_fields:
+                    updates[tuple(sorted(video_fields))].append(dict(video_fields, video_id=video_id))
+                    video.update(video_fields, version=video["version"] + 1)
+                    ranked.append(video)
+                results[index] = {"op": op, "video_id": video_id, "status": 200, "video": marshal(video, resource_fields)}
+
+            else:
+                if not video:
+                    results[index] = {"op": op, "video_id": video_id, "status": 404,
+                        "message": "Cannot delete because video with the given ID not found..."}
+                    continue
+                deletes.append(video_id)
+                results[index] = {"op": op, "video_id": video_id, "status": 204}
+
+        table = VideoModel.__table__
+        if inserts:
+            try:
+                db.session.execute(table.insert(), [video for index, video in inserts])
+            except IntegrityError:
+                # Another request has created some of the videos since they
+                # were looked up. Nothing else has been written yet, so start
+                # over and insert the videos one at a time, skipping the taken IDs.
+                db.session.rollback()
+                for index, video in inserts:
+                    if not insert_video_if_absent(video):
+                        ranked.remove(video)
+                        results[index] = {"op": "put", "video_id": video["_id"], "status": 409,
+                            "message": "Video ID already in use..."}
+        for columns, params in updates.items():
+            # The names of the bound parameters can't be the same as the
+            # names of the columns being updated.
+            statement = (
+                table.update()
+                .where(table.c._id == bindparam("video_id"))
+                .values({column: bindparam(column + "_value") for column in columns}, version=table.c.version + 1)
+            )
+            db.session.execute(statement, [
+                {"video_id": param["video_id"], **{column + "_value": param[column] for column in columns}}
+                for param in params
+            ])
+        if deletes:
+            db.session.execute(table.delete().where(table.c._id.in_(deletes)))
+        db.session.commit()
+        invalidate_videos(*seen_ids)
+        update_video_leaderboards(ranked)
+        if deletes:
+            discard_from_video_leaderboards(*deletes)
+
+        return {"results": results}
+
+
+class VideoTop(Resource):
+    """Handles all requests related to the endpoint: /videos/top"""
+
+    def get(self):
+        """Handles GET requests which take the column to rank the videos
+        by in the 'by' query string parameter (views or likes, views by
+        default) and the number of videos to list in 'n' (10 by default).
+
+        Returns a dict containing the list of the top videos, the highest
+        ranking first. The ranking is read from the in-memory leaderboard of
+        the column and the videos from the video cache, fetching the ones
+        which aren't cached with a single query.
+
+        Abort with a 400 error code if 'by' isn't valid or if 'n' isn't
+        between 1 and VIDEO_TOP_MAX_N.
+        """
+        args = video_top_args.parse_args()
+        if not 1 <= args["n"] <= VIDEO_TOP_MAX_N:
+            abort(400, message=f"n should be between 1 and {VIDEO_TOP_MAX_N}...")
+
+        ranking = video_leaderboards[args["by"]].top(args["n"])
+
+        videos = {}
+        for video_id, score in ranking:
+            video = video_cache.get(video_id)
+            if video:
+                videos[video_id] = video
+        missing = [video_id for video_id, score in ranking if video_id not in videos]
+        if missing:
+            generation = video_cache.current_generation()
+            for video_id, video in load_videos(missing).items():
+                video_cache.set(video_id, video, generation)
+                videos[video_id] = video
+
+        # A video deleted while the ranking was being read is left out
+        return {"videos": [marshal(videos[video_id], resource_fields) for video_id, score in ranking if video_id in videos]}
+
+
+class CacheStats(Resource):
+    """Handles all requests related to the endpoint: /internal/cache"""
+
+    def get(self):
+        """Handles GET requests and returns a dict containing the size
+        and the hit, miss and eviction counters of the video cache, along
+        with the counters of the coalesced loads of videos, the number of
+        increments buffered by the counter aggregator and the size and
+        counters of the leaderboards.
+        """
+        return {
+            "videos": video_cache.stats(),
+            "loads": video_loads.stats(),
+            "counters": video_counters.stats(),
+            "channel": invalidation_channel.stats(),
+            "leaderboards": {column: leaderboard.stats() for column, leaderboard in video_leaderboards.items()}
+        }
+
+
 # Register resources and connect it to their respective URL endpoints
 api.add_resource(Video, "/video/<int:video_id>")
+api.add_resource(VideoCounter, "/video/<int:video_id>/view", endpoint="video_view",
+    resource_class_kwargs={"column": "views"})
+api.add_resource(VideoCounter, "/video/<int:video_id>/like", endpoint="video_like",
+    resource_class_kwargs={"column": "likes"})
+api.add_resource(VideoBatch, "/videos/batch")
+api.add_resource(VideoTop, "/videos/top")
+api.add_resource(CacheStats, "/internal/cache")
+
+# Number of videos inserted by every transaction of `flask videos import` and
+# fetched by every query of `flask videos export`
+VIDEO_BULK_BATCH_SIZE = 1000
+# Fields of the videos in the files of `flask videos import/export`, along
+# with their type and whether an imported video must have them
+VIDEO_BULK_FIELDS = {"_id": (int, True), "name": (str, True), "views": (int, True), "likes": (int, True)}
+
+videos_cli = AppGroup("videos", help="Import and export the videos table.")
+app.cli.add_command(videos_cli)
+
+
+def iter_video_batches(batch_size=VIDEO_BULK_BATCH_SIZE):
+    """Generator which walks the videos table in ascending order of ID and
+    yields the rows as lists of (_id, name, views, likes) tuples containing
+    at most batch_size rows each.
+
+    Every batch is fetched with its own query starting right after the last
+    ID of the previous batch, so only a single batch is held in memory.
+    """
+    after_id = None
+    while True:
+        query = db.session.query(VideoModel._id, VideoModel.name, VideoModel.views, VideoModel.likes)
+        if after_id is not None:
+            query = query.filter(VideoModel._id > after_id)
+        batch = query.order_by(VideoModel._id).limit(batch_size).all()
+
+        if batch:
+            yield batch
+        if len(batch) < batch_size:
+            return
+
+        after_id = batch[-1]._id
+
+
+@videos_cli.command("import")
+@click.argument("source", type=click.File("r", encoding="utf-8"), default="-")
+@click.option("--format", "format_", type=click.Choice(FORMATS), help="Format of the file, guessed from its extension by default")
+@click.option("--batch-size", type=click.IntRange(min=1), default=VIDEO_BULK_BATCH_SIZE, show_default=True,
+    help="Number of videos inserted by every transaction")
+def import_videos(source, format_, batch_size):
+    """Insert the videos of a CSV or NDJSON file (or of stdin) into the database.
+
+    Every video has an _id, a name, a number of views and a number of likes.
+    The file is read as it's inserted, with a multi-row INSERT per batch, so
+    files of any size are imported in constant memory. Batches are committed
+    as they're inserted: if a video ID is already in use, the import stops
+    and the batches before the failing one stay imported.
+    """
+    progress = Progress("Imported", "videos")
+    for batch in batched(read_records(source, detect_format(source, format_), VIDEO_BULK_FIELDS), batch_size):
+        try:
+            db.session.execute(VideoModel.__table__.insert(), batch)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            progress.done()
+            raise click.ClickException(
+                f"A video ID of the videos {progress.rows + 1} to {progress.rows + len(batch)} is already in use"
+            )
+        progress.add(len(batch))
+    progress.done()
+
+
+@videos_cli.command("export")
+@click.argument("destination", type=click.File("w", encoding="utf-8"), default="-")
+@click.option("--format", "format_", type=click.Choice(FORMATS), help="Format of the file, guessed from its extension by default")
+@click.option("--batch-size", type=click.IntRange(min=1), default=VIDEO_BULK_BATCH_SIZE, show_default=True,
+    help="Number of videos fetched by every query")
+def export_videos(destination, format_, batch_size):
+    """Write every video, in order of ID, to a CSV or NDJSON file (or to stdout).
+
+    The table is read in batches (see iter_video_batches), so tables of any
+    size are exported in constant memory.
+    """
+    progress = Progress("Exported", "videos")
+
+    def rows():
+        for batch in iter_video_batches(batch_size):
+            yield from batch
+            progress.add(len(batch))
+
+    write_records(destination, detect_format(destination, format_), list(VIDEO_BULK_FIELDS), rows())
+    progress.done()
+
 
 # Run a local development server in debug mode.
 if __name__ == "__main__":
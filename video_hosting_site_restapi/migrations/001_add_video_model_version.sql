@@ -0,0 +1,11 @@
+-- Adds the version of a video, which every modification of the video
+-- increments and which its ETag is built from (see video_etag in main.py),
+-- and the indexes on views and likes which the /videos/top leaderboards are
+-- loaded from. Databases created with db.create_all() by the current
+-- VideoModel already have them; apply this script to a database.db created
+-- before, while the app is stopped:
+--
+--     sqlite3 database.db < migrations/001_add_video_model_version.sql
+ALTER TABLE video_model ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+CREATE INDEX IF NOT EXISTS ix_video_model_views ON video_model (views);
+CREATE INDEX IF NOT EXISTS ix_video_model_likes ON video_model (likes);
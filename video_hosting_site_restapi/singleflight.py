@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """A load in flight and the callers waiting for its result."""
+
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent loads of the same key, so that the callers
+    asking for a key which is already being loaded wait for that load and
+    share its result (or its exception) instead of running the same query
+    again. Loads only last as long as they're in flight: a caller coming
+    after a load has finished runs a new one.
+
+    At most max_waiters callers wait for the same load. The callers beyond
+    that run their own load rather than queueing up behind a load which
+    may be stuck.
+
+    do() is called by threads (e.g. the ones of Flask's threaded server)
+    and do_async() by the coroutines of an event loop. Both keep count of
+    the loads run, the loads shared with another caller (i.e. the queries
+    saved) and the callers which didn't wait because too many already were.
+    """
+
+    def __init__(self, max_waiters=100):
+        self.max_waiters = max_waiters
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+        self.loads = 0
+        self.coalesced = 0
+        self.overflows = 0
+
+    def do(self, key, loader):
+        """Return the result of loader(), or of the load of the same key
+        already in flight if there is one.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.loads += 1
+                leader = True
+            elif call.waiters >= self.max_waiters:
+                self.overflows += 1
+                self.loads += 1
+                call = None
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if call is None:
+            return loader()
+
+        if leader:
+            try:
+                call.value = loader()
+            except BaseException as error:
+                call.error = error
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.value
+
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    async def do_async(self, key, loader):
+        """Asynchronous counterpart of do(), where loader() returns an
+        awaitable.
+
+        The load runs in a task of its own, so that it goes on for the
+        other callers if the one which started it is cancelled (e.g. because
+        its client disconnected).
+        """
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is None:
+                task = asyncio.ensure_future(loader())
+                entry = self._tasks[key] = [task, 0]
+                task.add_done_callback(lambda task: self._finish_task(key, task))
+                self.loads += 1
+            elif entry[1] >= self.max_waiters:
+                self.overflows += 1
+                self.loads += 1
+                entry = None
+            else:
+                entry[1] += 1
+                self.coalesced += 1
+
+        if entry is None:
+            return await loader()
+        return await asyncio.shield(entry[0])
+
+    def stats(self):
+        """Return a dict containing the configuration, the number of loads
+        in flight and the counters of the coalescing.
+        """
+        with self._lock:
+            return {
+                "max_waiters": self.max_waiters,
+                "in_flight": len(self._calls) + len(self._tasks),
+                "loads": self.loads,
+                "coalesced": self.coalesced,
+                "overflows": self.overflows
+            }
+
+    def _finish_task(self, key, task):
+        with self._lock:
+            if self._tasks.get(key, (None,))[0] is task:
+                del self._tasks[key]
+        # Mark the exception as retrieved, in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
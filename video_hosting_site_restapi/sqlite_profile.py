@@ -0,0 +1,56 @@
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# PRAGMAs applied to every new connection to a SQLite database:
+#   1. journal_mode - WAL lets readers keep reading while a writer commits,
+#                     instead of blocking behind the rollback journal.
+#   2. synchronous  - NORMAL only syncs the WAL at checkpoints, which is safe
+#                     from corruption in WAL mode. A power loss can undo the
+#                     last few commits.
+#   3. mmap_size    - Read up to 256 MiB of the database through a memory map
+#                     shared by all the connections instead of copying pages.
+#   4. cache_size   - Keep up to 64 MiB (given in KiB when negative) of pages
+#                     in the cache of every connection.
+#   5. busy_timeout - Wait up to 5 seconds for a lock held by another
+#                     connection before failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+    "cache_size": -65536,
+    "busy_timeout": 5000
+}
+
+# Engine options for a threaded server: keep a pool of connections (which
+# SQLite requires to be shareable across threads) rather than opening a new
+# connection, and running the PRAGMAs, for every request. The pool class has
+# to be given explicitly as Flask-SQLAlchemy defaults to a NullPool for SQLite.
+SQLITE_ENGINE_OPTIONS = {
+    "poolclass": QueuePool,
+    "pool_size": 10,
+    "max_overflow": 20,
+    "connect_args": {"check_same_thread": False}
+}
+
+
+class TunedSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy extension which applies the given PRAGMAs to every
+    connection opened by the SQLite engines it creates.
+    """
+
+    def __init__(self, app=None, pragmas=None, **kwargs):
+        self.pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+        super().__init__(app, **kwargs)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        if engine.dialect.name == "sqlite" and self.pragmas:
+            event.listen(engine, "connect", self._apply_pragmas)
+        return engine
+
+    def _apply_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
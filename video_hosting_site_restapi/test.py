@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
 BASE = "http://127.0.0.1:5000/"
@@ -19,3 +21,33 @@ print(response.json())
 input()
 response = requests.patch(BASE + "video/2", {"views": 99, "likes": 11})
 print(response.json())
+
+input()
+batch = {
+    "put": [{"video_id": 3, "name": "Batch Video", "views": 10, "likes": 1}],
+    "patch": [{"video_id": 0, "likes": 100}],
+    "delete": [1]
+}
+response = requests.post(BASE + "videos/batch", json=batch)
+print(response.json())
+
+input()
+response = requests.get(BASE + "videos/batch", {"ids": "0,1,2,3"})
+print(response.json())
+
+input()
+for _ in range(10):
+    requests.post(BASE + "video/0/view")
+requests.post(BASE + "video/0/like")
+response = requests.get(BASE + "internal/cache")
+print(response.json())
+
+input()
+response = requests.get(BASE + "videos/top", {"by": "likes", "n": 3})
+print(response.json())
+
+input()
+with ThreadPoolExecutor(max_workers=20) as executor:
+    list(executor.map(lambda _: requests.get(BASE + "video/2"), range(20)))
+response = requests.get(BASE + "internal/cache")
+print(response.json()["loads"])